@@ -1,14 +1,30 @@
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import asyncio
+import time
 import jwt
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import make_transient_to_detached
 
 from app.models.users import User as UserModel
-from app.config import SECRET_KEY, ALGORITHM
+from app.config import (
+    SECRET_KEY,
+    ALGORITHM,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_QUEUE_SIZE,
+    AUTH_STATELESS,
+)
 from app.db_depends import get_async_db
+from app.cache import TTLCache, register_invalidator
+from app.revocation import revocation_list
+from app import metrics
 
 
 # Создаём контекст для хеширования с использованием bcrypt
@@ -19,6 +35,46 @@ REFRESH_TOKEN_EXPIRE_DAYS = 7
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/token")
 
+# Кэш активных пользователей по id из токена. Сбрасывается через invalidate("users", id)
+# при деактивации или смене роли, а TTL ограничивает устаревание между воркерами.
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def invalidate_cached_user(user_id: int | None) -> None:
+    """
+    Удаляет пользователя из кэша (или весь кэш, если user_id не указан).
+    """
+    if user_id is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop(user_id)
+
+
+register_invalidator("users", invalidate_cached_user)
+
+
+def user_cache_stats() -> dict:
+    """
+    Размер кэша пользователей и счётчики попаданий/промахов.
+    """
+    return _user_cache.stats()
+
+
+def _detached_copy(user: UserModel) -> UserModel:
+    """
+    Копия пользователя, не привязанная ни к одной сессии, — её безопасно
+    отдавать из кэша в разные запросы.
+    """
+    copy = UserModel(
+        id=user.id,
+        email=user.email,
+        hashed_password=user.hashed_password,
+        is_active=user.is_active,
+        role=user.role,
+    )
+    make_transient_to_detached(copy)
+    return copy
+
 def hash_password(password: str) -> str:
     """
     Преобразует пароль в хеш с использованием bcrypt.
@@ -33,6 +89,83 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+# bcrypt отпускает GIL, поэтому отдельного пула потоков достаточно, чтобы
+# хеширование не блокировало event loop. Семафор ограничивает очередь:
+# при её переполнении запрос сразу получает 503, а не копится в памяти.
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                        thread_name_prefix="bcrypt")
+_password_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE)
+_password_stats = {
+    "in_flight": 0,
+    "calls": 0,
+    "rejected": 0,
+    "hash_seconds_total": 0.0,
+    "hash_seconds_max": 0.0,
+    "wait_seconds_total": 0.0,
+}
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+async def _run_in_password_pool(func, *args):
+    if _password_slots.locked():
+        _password_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, try again later",
+            headers={"Retry-After": "1"},
+        )
+    async with _password_slots:
+        _password_stats["in_flight"] += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, hash_seconds = await loop.run_in_executor(_password_executor, _timed, func, *args)
+        finally:
+            _password_stats["in_flight"] -= 1
+        _password_stats["calls"] += 1
+        _password_stats["hash_seconds_total"] += hash_seconds
+        _password_stats["hash_seconds_max"] = max(_password_stats["hash_seconds_max"], hash_seconds)
+        _password_stats["wait_seconds_total"] += time.perf_counter() - start - hash_seconds
+        metrics.observe("password_hash_duration_seconds", (), hash_seconds)
+        return result
+
+
+async def hash_password_async(password: str) -> str:
+    """
+    То же, что hash_password, но выполняется в пуле потоков bcrypt.
+    """
+    return await _run_in_password_pool(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    То же, что verify_password, но выполняется в пуле потоков bcrypt.
+    """
+    return await _run_in_password_pool(verify_password, plain_password, hashed_password)
+
+
+metrics.register_collector(lambda: [
+    ("password_hash_in_flight", (), _password_stats["in_flight"]),
+    ("password_hash_rejected_total", (), _password_stats["rejected"]),
+])
+
+
+def password_hasher_stats() -> dict:
+    """
+    Метрики пула bcrypt: глубина очереди, число вызовов и время хеширования.
+    """
+    return {
+        **_password_stats,
+        "workers": PASSWORD_HASH_WORKERS,
+        "queue_depth": max(0, _password_stats["in_flight"] - PASSWORD_HASH_WORKERS),
+    }
+
+
 def create_access_token(data: dict):
     """
     Создаёт JWT с payload (sub, role, id, exp).
@@ -56,21 +189,37 @@ def create_refresh_token(data: dict):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme),
-                           db: AsyncSession = Depends(get_async_db)):
+@dataclass(frozen=True, slots=True)
+class TokenPrincipal:
     """
-    Проверяет JWT и возвращает пользователя из базы.
+    Пользователь, восстановленный из claims access-токена без обращения к БД.
+    Повторяет поля UserModel, которые нужны роутерам.
     """
-    credentials_exception = HTTPException(
+    id: int
+    email: str
+    role: str
+    is_active: bool = True
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _decode_access_token(token: str) -> dict:
+    """
+    Проверяет подпись, срок действия и тип JWT и возвращает его payload.
+    Refresh-токен вместо access-токена не принимается.
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
+        token_type: str | None = payload.get("token_type")
+        if email is None or token_type != "access":
+            raise _credentials_exception()
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -78,15 +227,56 @@ async def get_current_user(token: str = Depends(oauth2_scheme),
             headers={"WWW-Authenticate": "Bearer"},
         )
     except jwt.PyJWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    return payload
+
+
+async def _load_user(payload: dict, db: AsyncSession) -> UserModel:
+    email = payload["sub"]
+    user_id = payload.get("id")
+    if user_id is not None:
+        cached = _user_cache.get(user_id)
+        if cached is not None and cached.email == email:
+            return cached
+
     result = await db.scalars(
         select(UserModel).where(UserModel.email == email, UserModel.is_active == True))
     user = result.first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    _user_cache.set(user.id, _detached_copy(user))
     return user
 
-async def get_current_seller(current_user: UserModel = Depends(get_current_user)):
+
+async def get_current_user(token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(get_async_db)):
+    """
+    Проверяет JWT и возвращает пользователя из базы.
+    """
+    return await _load_user(_decode_access_token(token), db)
+
+
+async def get_token_principal(token: str = Depends(oauth2_scheme),
+                              db: AsyncSession = Depends(get_async_db)) -> TokenPrincipal | UserModel:
+    """
+    Проверяет JWT и возвращает пользователя.
+
+    При AUTH_STATELESS=true пользователь собирается из claims токена (sub, id, role)
+    без запроса в БД, если список отзыва свежий и подтверждает claims.
+    Иначе — как get_current_user.
+    """
+    payload = _decode_access_token(token)
+    user_id, role = payload.get("id"), payload.get("role")
+    if AUTH_STATELESS and user_id is not None and role is not None:
+        valid = revocation_list.check(user_id, role)
+        if valid is False:
+            raise _credentials_exception()
+        if valid:
+            return TokenPrincipal(id=user_id, email=payload["sub"], role=role)
+    return await _load_user(payload, db)
+
+
+async def get_current_seller(current_user: TokenPrincipal | UserModel = Depends(get_token_principal)):
     """
     Проверяет, что пользователь имеет роль 'seller'.
     """
@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+
+class TTLCache:
+    """
+    Ограниченный по размеру LRU-кэш с временем жизни записей.
+    Живёт внутри одного процесса и используется из event loop, поэтому без блокировок.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Обработчики инвалидации по сущностям ("products", "categories", "users").
+# "stock" — изменился только остаток товара: сбрасываются лишь ответы с этим товаром.
+# Роутеры, изменяющие данные, вызывают invalidate(), а кэши подписываются на него.
+_invalidators: dict[str, list[Callable[[int | None], None]]] = {}
+
+
+def register_invalidator(entity: str, callback: Callable[[int | None], None]) -> None:
+    """
+    Регистрирует функцию, которая вызывается при изменении сущности.
+    В callback передаётся ID изменённой записи или None, если изменилось всё.
+    """
+    _invalidators.setdefault(entity, []).append(callback)
+
+
+def invalidate(entity: str, entity_id: int | None = None) -> None:
+    """
+    Сообщает всем подписанным кэшам, что сущность изменилась.
+    """
+    for callback in _invalidators.get(entity, ()):
+        callback(entity_id)
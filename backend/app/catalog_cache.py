@@ -0,0 +1,422 @@
+import asyncio
+import hashlib
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Sequence
+from typing import Any
+
+from fastapi import Request, Response, status
+
+from app.cache import register_invalidator
+from app.config import (
+    CATALOG_CACHE_MAX_AGE,
+    CATALOG_STALE_WHILE_REVALIDATE,
+    CATALOG_RESULT_CACHE_BACKEND,
+    CATALOG_RESULT_CACHE_URL,
+    CATALOG_RESULT_CACHE_TTL,
+    CATALOG_RESULT_CACHE_MAX_BYTES,
+    CATALOG_RESULT_CACHE_MAX_ENTRIES,
+    CATALOG_RESULT_CACHE_DIRTY_SECONDS,
+    READ_YOUR_WRITES_SECONDS,
+)
+from app.responses import RawJSONResponse
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # redis — необязательная зависимость
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+
+def _etag(payload: bytes) -> str:
+    # ETag — хэш тела ответа: у одинаковых данных он одинаков во всех воркерах и узлах
+    return f'W/"{hashlib.blake2b(payload, digest_size=16).hexdigest()}"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+def catalog_response(request: Request, payload: bytes) -> Response:
+    """
+    Ответ публичного эндпоинта каталога из сериализованного JSON.
+
+    Выставляет ETag по содержимому и Cache-Control; если у клиента та же версия
+    ответа (If-None-Match), отвечает 304 без тела. Для ответов из кэша результатов
+    это обходится без запросов к БД.
+    """
+    etag = _etag(payload)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": (
+            f"public, max-age={CATALOG_CACHE_MAX_AGE}, "
+            f"stale-while-revalidate={CATALOG_STALE_WHILE_REVALIDATE}"
+        ),
+    }
+    if _not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return RawJSONResponse(content=payload, headers=headers)
+
+
+class CacheBackend(ABC):
+    """
+    Хранилище сериализованных ответов каталога: ключ — строка, значение — байты JSON.
+
+    get возвращает вместе со значением метку состояния хранилища, set записывает
+    значение только если с момента get хранилище не сбрасывалось (compare-and-set).
+
+    Вместе с ответом запоминаются ID товаров в нём: invalidate_products удаляет
+    только ответы с этими товарами и на dirty_seconds запрещает записывать ответы
+    с ними — ответ, построенный по данным до изменения, в кэш уже не попадёт.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> tuple[bytes | None, Any]: ...
+
+    @abstractmethod
+    async def set(
+        self, key: str, value: bytes, ttl: int, token: Any, product_ids: Sequence[int] = ()
+    ) -> None: ...
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+    @abstractmethod
+    async def invalidate_products(self, product_ids: Sequence[int]) -> None: ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    LRU-кэш в памяти процесса с ограничением по числу записей и суммарному размеру.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int, dirty_seconds: float):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.dirty_seconds = dirty_seconds
+        self.size_bytes = 0
+        self.evictions = 0
+        # ключ → (истекает, ответ, ID товаров в ответе)
+        self._data: OrderedDict[str, tuple[float, bytes, tuple[int, ...]]] = OrderedDict()
+        # ID товара → ключи ответов, в которых он есть
+        self._refs: dict[int, set[str]] = {}
+        # ID товара → до какого момента ответы с ним не записываются
+        self._dirty: dict[int, float] = {}
+
+    async def get(self, key: str) -> tuple[bytes | None, Any]:
+        # Сбросы кэша в памяти отслеживает сам CatalogResultCache, своя метка не нужна
+        entry = self._data.get(key)
+        if entry is None:
+            return None, None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            return None, None
+        self._data.move_to_end(key)
+        return entry[1], None
+
+    async def set(
+        self, key: str, value: bytes, ttl: int, token: Any = None, product_ids: Sequence[int] = ()
+    ) -> None:
+        if len(value) > self.max_bytes:
+            return
+        now = time.monotonic()
+        if any(self._dirty.get(product_id, 0) > now for product_id in product_ids):
+            return
+        self._remove(key)
+        self._data[key] = (now + ttl, value, tuple(product_ids))
+        self.size_bytes += len(value)
+        for product_id in product_ids:
+            self._refs.setdefault(product_id, set()).add(key)
+        while self.size_bytes > self.max_bytes or len(self._data) > self.max_entries:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def clear(self) -> None:
+        self.clear_now()
+
+    def clear_now(self) -> None:
+        self._data.clear()
+        self._refs.clear()
+        self.size_bytes = 0
+
+    async def invalidate_products(self, product_ids: Sequence[int]) -> None:
+        self.invalidate_products_now(product_ids)
+
+    def invalidate_products_now(self, product_ids: Sequence[int]) -> None:
+        now = time.monotonic()
+        self._dirty = {product_id: until for product_id, until in self._dirty.items() if until > now}
+        for product_id in product_ids:
+            self._dirty[product_id] = now + self.dirty_seconds
+            for key in list(self._refs.get(product_id, ())):
+                self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        self.size_bytes -= len(entry[1])
+        for product_id in entry[2]:
+            keys = self._refs.get(product_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._refs[product_id]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Кэш в Redis-совместимом хранилище, общий для всех воркеров и узлов.
+    Для одного хоста достаточно локального сервера на unix-сокете (unix:///path).
+    Ограничение размера и LRU-вытеснение задаются на стороне сервера (maxmemory-policy).
+
+    Ключи содержат номер поколения, который хранится в самом Redis. Сброс кэша —
+    один INCR: записи прошлых поколений больше не читаются и истекают по TTL.
+    Поколение подставляется скриптом на сервере, поэтому чтение и запись
+    остаются одним обращением к Redis.
+
+    get возвращает поколение, в котором искал ключ, а set записывает значение,
+    только если поколение не изменилось: ответ, построенный до чужого сброса,
+    не попадёт в новое поколение.
+
+    Для каждого товара ведётся множество ключей ответов с ним (<поколение>:refs:<id>)
+    и метка «изменён» (dirty:<id>) с коротким TTL.
+    """
+
+    _GET_SCRIPT = """
+        local generation = redis.call('GET', KEYS[1]) or '0'
+        return {generation, redis.call('GET', ARGV[1] .. generation .. ':' .. ARGV[2])}
+    """
+    # ARGV: префикс, ключ, значение, TTL, поколение из get, ID товаров...
+    _SET_SCRIPT = """
+        local generation = redis.call('GET', KEYS[1]) or '0'
+        if generation ~= ARGV[5] then
+            return 0
+        end
+        for i = 6, #ARGV do
+            if redis.call('EXISTS', ARGV[1] .. 'dirty:' .. ARGV[i]) == 1 then
+                return 0
+            end
+        end
+        local key = ARGV[1] .. generation .. ':' .. ARGV[2]
+        redis.call('SET', key, ARGV[3], 'EX', ARGV[4])
+        for i = 6, #ARGV do
+            local refs = ARGV[1] .. generation .. ':refs:' .. ARGV[i]
+            redis.call('SADD', refs, key)
+            redis.call('EXPIRE', refs, ARGV[4])
+        end
+        return 1
+    """
+    # ARGV: префикс, TTL метки dirty, ID товаров...
+    _INVALIDATE_PRODUCTS_SCRIPT = """
+        local generation = redis.call('GET', KEYS[1]) or '0'
+        for i = 3, #ARGV do
+            redis.call('SET', ARGV[1] .. 'dirty:' .. ARGV[i], '1', 'EX', ARGV[2])
+            local refs = ARGV[1] .. generation .. ':refs:' .. ARGV[i]
+            for _, key in ipairs(redis.call('SMEMBERS', refs)) do
+                redis.call('DEL', key)
+            end
+            redis.call('DEL', refs)
+        end
+        return 1
+    """
+
+    def __init__(self, url: str, dirty_seconds: float, prefix: str = "catalog:"):
+        self.prefix = prefix
+        self.dirty_seconds = dirty_seconds
+        self.generation_key = prefix + "generation"
+        self._client = redis_asyncio.from_url(url)
+        self._get = self._client.register_script(self._GET_SCRIPT)
+        self._set = self._client.register_script(self._SET_SCRIPT)
+        self._invalidate_products = self._client.register_script(self._INVALIDATE_PRODUCTS_SCRIPT)
+
+    async def get(self, key: str) -> tuple[bytes | None, Any]:
+        generation, value = await self._get(keys=[self.generation_key], args=[self.prefix, key])
+        return value, generation
+
+    async def set(
+        self, key: str, value: bytes, ttl: int, token: Any, product_ids: Sequence[int] = ()
+    ) -> None:
+        await self._set(
+            keys=[self.generation_key], args=[self.prefix, key, value, ttl, token, *product_ids]
+        )
+
+    async def clear(self) -> None:
+        await self._client.incr(self.generation_key)
+
+    async def invalidate_products(self, product_ids: Sequence[int]) -> None:
+        await self._invalidate_products(
+            keys=[self.generation_key], args=[self.prefix, max(1, round(self.dirty_seconds)), *product_ids]
+        )
+
+
+# Метка get, прочитанного из кэша в памяти: set пишет туда же
+_FALLBACK = object()
+
+
+class CatalogResultCache:
+    """
+    Кэш ответов публичных эндпоинтов каталога поверх подключаемого бэкенда.
+
+    Если основной бэкенд недоступен, используется кэш в памяти процесса.
+
+    get возвращает метку, которую нужно передать в set: запись пропускается,
+    если каталог изменился (в этом воркере или, для общего бэкенда, в любом),
+    пока ответ строился.
+
+    Ответ, прочитанный с реплики, не кэшируется в течение READ_YOUR_WRITES_SECONDS
+    после сброса: реплика может ещё не получить изменение.
+    """
+
+    def __init__(self, backend: CacheBackend | None, fallback: MemoryCacheBackend, ttl: int):
+        self.backend = backend
+        self.fallback = fallback
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        # Число сбросов кэша в этом воркере
+        self.generation = 0
+        # Время последнего сброса (time.monotonic)
+        self.last_invalidated = 0.0
+        self._pending: set[asyncio.Task] = set()
+
+    async def get(self, key: str) -> tuple[bytes | None, tuple]:
+        generation = self.generation
+        backend_token = _FALLBACK
+        if self.backend is not None:
+            try:
+                value, backend_token = await self.backend.get(key)
+            except Exception:
+                self.errors += 1
+                logger.warning("Catalog cache backend is unavailable, using in-memory fallback")
+                backend_token = _FALLBACK
+                value, _ = await self.fallback.get(key)
+        else:
+            value, _ = await self.fallback.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value, (generation, backend_token)
+
+    async def set(
+        self, key: str, value: bytes, token: tuple,
+        product_ids: Sequence[int] = (), from_replica: bool = False,
+    ) -> None:
+        """
+        Сохраняет ответ. product_ids — товары в ответе: изменение остатка
+        любого из них удалит этот ответ (см. invalidate_product).
+        from_replica — ответ построен по данным реплики.
+        """
+        generation, backend_token = token
+        if generation != self.generation:
+            return
+        if from_replica and time.monotonic() - self.last_invalidated < READ_YOUR_WRITES_SECONDS:
+            return
+        if self.backend is not None and backend_token is not _FALLBACK:
+            try:
+                await self.backend.set(key, value, self.ttl, backend_token, product_ids)
+                return
+            except Exception:
+                self.errors += 1
+        await self.fallback.set(key, value, self.ttl, product_ids=product_ids)
+
+    def invalidate(self, entity_id: int | None = None) -> None:
+        """
+        Сбрасывает кэш при изменении каталога. Локальный кэш очищается сразу,
+        общий — фоновой задачей в текущем event loop.
+        """
+        self.generation += 1
+        self.last_invalidated = time.monotonic()
+        self.fallback.clear_now()
+        self._in_background(self._clear_backend)
+
+    def invalidate_product(self, product_id: int | None = None) -> None:
+        """
+        Удаляет только ответы, в которых есть товар (изменение остатка),
+        не трогая остальной кэш.
+        """
+        if product_id is None:
+            self.invalidate()
+            return
+        self.fallback.invalidate_products_now([product_id])
+        self._in_background(lambda: self._invalidate_backend_products([product_id]))
+
+    def _in_background(self, job: Callable[[], Awaitable[None]]) -> None:
+        if self.backend is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(job())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _clear_backend(self) -> None:
+        try:
+            await self.backend.clear()
+        except Exception:
+            self.errors += 1
+            logger.exception("Failed to clear catalog cache backend")
+
+    async def _invalidate_backend_products(self, product_ids: list[int]) -> None:
+        try:
+            await self.backend.invalidate_products(product_ids)
+        except Exception:
+            self.errors += 1
+            logger.exception("Failed to invalidate products in catalog cache backend")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend or self.fallback).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "errors": self.errors,
+            **(self.backend or self.fallback).stats(),
+        }
+
+
+def _create_backend() -> CacheBackend | None:
+    if CATALOG_RESULT_CACHE_BACKEND == "redis":
+        if redis_asyncio is None:
+            logger.warning("redis package is not installed, catalog cache falls back to memory")
+            return None
+        return RedisCacheBackend(CATALOG_RESULT_CACHE_URL, CATALOG_RESULT_CACHE_DIRTY_SECONDS)
+    return None
+
+
+catalog_results = CatalogResultCache(
+    backend=_create_backend(),
+    fallback=MemoryCacheBackend(
+        # off: нулевой лимит — в кэш ничего не попадает
+        max_bytes=CATALOG_RESULT_CACHE_MAX_BYTES
+        if CATALOG_RESULT_CACHE_BACKEND != "off" else 0,
+        max_entries=CATALOG_RESULT_CACHE_MAX_ENTRIES,
+        dirty_seconds=CATALOG_RESULT_CACHE_DIRTY_SECONDS,
+    ),
+    ttl=CATALOG_RESULT_CACHE_TTL,
+)
+register_invalidator("products", catalog_results.invalidate)
+register_invalidator("categories", catalog_results.invalidate)
+register_invalidator("stock", catalog_results.invalidate_product)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import invalidate
+from app.config import CHANGE_FEED_CHANNEL
+from app.database import DATABASE_DIRECT_URL
+
+logger = logging.getLogger(__name__)
+
+# Сущности, на изменения которых подписаны кэши
+ENTITIES = ("products", "categories", "users")
+
+# Идентификатор воркера: собственные уведомления он уже применил локально
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+HEALTH_CHECK_INTERVAL = 30
+# Сколько секунд ждать ответа на проверку соединения; дольше — считаем соединение потерянным
+HEALTH_CHECK_TIMEOUT = 5
+MAX_RECONNECT_DELAY = 30
+
+
+async def publish_change(db: AsyncSession, entity: str, entity_id: int | list[int] | None = None) -> None:
+    """
+    Ставит NOTIFY об изменении сущности в текущую транзакцию.
+    PostgreSQL доставит его слушателям только после commit.
+    Список ID отправляется одним уведомлением.
+    """
+    payload = json.dumps({"entity": entity, "id": entity_id, "origin": WORKER_ID})
+    await db.execute(select(func.pg_notify(CHANGE_FEED_CHANNEL, payload)))
+
+
+def flush_all() -> None:
+    """
+    Сбрасывает все кэши: вызывается, когда часть уведомлений могла потеряться.
+    """
+    for entity in ENTITIES:
+        invalidate(entity, None)
+
+
+def _on_notification(connection, pid, channel, payload: str) -> None:
+    try:
+        message = json.loads(payload)
+        entity, entity_id = message["entity"], message.get("id")
+    except (ValueError, TypeError, KeyError):
+        logger.warning("Malformed change notification: %r", payload)
+        return
+    if message.get("origin") == WORKER_ID:
+        return
+    if isinstance(entity_id, list):
+        for item_id in entity_id:
+            invalidate(entity, item_id)
+        return
+    invalidate(entity, entity_id)
+
+
+async def run_change_listener() -> None:
+    """
+    Фоновая задача воркера: слушает канал изменений на отдельном соединении asyncpg.
+
+    При обрыве соединения переподключается с экспоненциальной задержкой,
+    а после переподключения сбрасывает все кэши, так как пропущенные
+    за это время уведомления не восстановить.
+    """
+    dsn = make_url(DATABASE_DIRECT_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+    delay = 1
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn)
+            lost = asyncio.Event()
+            connection.add_termination_listener(lambda _: lost.set())
+            await connection.add_listener(CHANGE_FEED_CHANNEL, _on_notification)
+            flush_all()
+            delay = 1
+            logger.info("Change feed listener connected to channel %s", CHANGE_FEED_CHANNEL)
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), timeout=HEALTH_CHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    # Полуоткрытое соединение без проверки может «молчать» вечно
+                    try:
+                        await connection.execute("SELECT 1", timeout=HEALTH_CHECK_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        # Закрыть такое соединение штатно не выйдет — только разорвать
+                        connection.terminate()
+                        break
+            logger.warning("Change feed connection lost")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Change feed listener failed")
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        flush_all()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, MAX_RECONNECT_DELAY)
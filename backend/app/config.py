@@ -4,4 +4,113 @@ from dotenv import load_dotenv
 
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = "HS256"
\ No newline at end of file
+ALGORITHM = "HS256"
+
+# Кэш количества товаров для списков с фильтрами
+PRODUCT_COUNT_CACHE_SIZE = int(os.getenv("PRODUCT_COUNT_CACHE_SIZE", "1024"))
+PRODUCT_COUNT_CACHE_TTL = float(os.getenv("PRODUCT_COUNT_CACHE_TTL", "30"))
+
+# Границы ценовых корзин фасета price (через запятую, по возрастанию)
+PRODUCT_PRICE_FACET_BOUNDS = [
+    int(bound) for bound in os.getenv("PRODUCT_PRICE_FACET_BOUNDS", "500,1000,5000,10000,50000").split(",")
+]
+
+
+# Кэш пользователей для get_current_user (в пределах одного процесса)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+# Пул потоков для bcrypt: число потоков и сколько запросов может ждать в очереди
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "64"))
+
+# Режим аутентификации только по claims токена (без запроса пользователя в БД).
+# Корректность обеспечивает список отзыва, который периодически читается из users.
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "false").lower() == "true"
+AUTH_REVOCATION_REFRESH_SECONDS = float(os.getenv("AUTH_REVOCATION_REFRESH_SECONDS", "30"))
+AUTH_REVOCATION_MAX_AGE = float(os.getenv("AUTH_REVOCATION_MAX_AGE", "120"))
+
+# Cache-Control для публичных эндпоинтов каталога (секунды)
+CATALOG_CACHE_MAX_AGE = int(os.getenv("CATALOG_CACHE_MAX_AGE", "30"))
+CATALOG_STALE_WHILE_REVALIDATE = int(os.getenv("CATALOG_STALE_WHILE_REVALIDATE", "60"))
+
+# Кэш сериализованных ответов каталога.
+# Бэкенд: memory — свой в каждом процессе, не общий для воркеров;
+# redis — общий для всех воркеров и узлов (Redis-совместимое хранилище, в т.ч. по unix-сокету); off
+CATALOG_RESULT_CACHE_BACKEND = os.getenv("CATALOG_RESULT_CACHE_BACKEND", "memory")
+CATALOG_RESULT_CACHE_URL = os.getenv("CATALOG_RESULT_CACHE_URL", "redis://localhost:6379/0")
+CATALOG_RESULT_CACHE_TTL = int(os.getenv("CATALOG_RESULT_CACHE_TTL", "300"))
+CATALOG_RESULT_CACHE_MAX_BYTES = int(os.getenv("CATALOG_RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CATALOG_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_RESULT_CACHE_MAX_ENTRIES", "10000"))
+# Сколько секунд после изменения остатка товара ответы с ним не записываются в кэш:
+# ответ, построенный по данным до изменения (или с отстающей реплики), не попадёт в кэш
+CATALOG_RESULT_CACHE_DIRTY_SECONDS = float(os.getenv("CATALOG_RESULT_CACHE_DIRTY_SECONDS", "5"))
+
+# Рассылка изменений через LISTEN/NOTIFY для инвалидации кэшей во всех воркерах
+CHANGE_FEED_ENABLED = os.getenv("CHANGE_FEED_ENABLED", "true").lower() == "true"
+CHANGE_FEED_CHANNEL = os.getenv("CHANGE_FEED_CHANNEL", "app_changes")
+# Потоковая выгрузка: сколько строк читать одним запросом (одна короткая транзакция)
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+# Массовый импорт товаров
+PRODUCT_IMPORT_MAX_BYTES = int(os.getenv("PRODUCT_IMPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+# Файлы больше этого размера обрабатываются фоновой задачей
+PRODUCT_IMPORT_INLINE_MAX_BYTES = int(os.getenv("PRODUCT_IMPORT_INLINE_MAX_BYTES", str(1024 * 1024)))
+PRODUCT_IMPORT_BATCH_SIZE = int(os.getenv("PRODUCT_IMPORT_BATCH_SIZE", "1000"))
+# Сколько ошибок по строкам сохранять в отчёте (остальные только считаются)
+PRODUCT_IMPORT_MAX_ERRORS = int(os.getenv("PRODUCT_IMPORT_MAX_ERRORS", "1000"))
+
+# Загрузка изображений товаров: сколько загрузок обрабатывается одновременно
+# и сколько может ждать очереди (остальные сразу получают 503)
+IMAGE_UPLOAD_CONCURRENCY = int(os.getenv("IMAGE_UPLOAD_CONCURRENCY", "8"))
+IMAGE_UPLOAD_QUEUE_SIZE = int(os.getenv("IMAGE_UPLOAD_QUEUE_SIZE", "32"))
+
+# Процессы для генерации уменьшенных WebP-вариантов изображений (0 — не генерировать)
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "2"))
+
+# Раздача /media: кэширование в браузере и горячий кэш небольших файлов в памяти воркера
+MEDIA_IMMUTABLE_MAX_AGE = int(os.getenv("MEDIA_IMMUTABLE_MAX_AGE", str(365 * 24 * 3600)))
+MEDIA_MAX_AGE = int(os.getenv("MEDIA_MAX_AGE", "3600"))
+MEDIA_HOT_CACHE_ENTRIES = int(os.getenv("MEDIA_HOT_CACHE_ENTRIES", "512"))
+MEDIA_HOT_CACHE_FILE_SIZE = int(os.getenv("MEDIA_HOT_CACHE_FILE_SIZE", str(128 * 1024)))
+MEDIA_HOT_CACHE_TTL = float(os.getenv("MEDIA_HOT_CACHE_TTL", "300"))
+
+# Пул соединений и драйвер БД
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Размер кэша подготовленных запросов на соединение (asyncpg и SQLAlchemy)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# Совместимость с PgBouncer в режиме pool_mode=transaction: без кэша подготовленных
+# запросов и с уникальными именами prepared statements
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+# Доступ к /api/internal/*: токен в заголовке X-Internal-Token;
+# если токен не задан, эндпоинты доступны только с localhost
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
+# Реплики для чтения каталога (через запятую); пусто — всё читается с основной БД
+DATABASE_REPLICA_URLS = [
+    url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+# На сколько секунд реплика исключается из ротации после ошибки соединения
+REPLICA_EJECT_SECONDS = float(os.getenv("REPLICA_EJECT_SECONDS", "30"))
+# Сколько секунд после своей записи клиент читает с основной БД (read-your-writes);
+# столько же после сброса кэша каталога не кэшируются ответы, прочитанные с реплики
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# Метрики Prometheus: каталог для снимков метрик воркеров (общий для всех воркеров
+# одного хоста) и период их сохранения. Снимки предыдущих запусков сервиса
+# (другой родительский процесс) не учитываются и удаляются при старте воркера.
+# Пусто — /metrics отдаёт только свой воркер
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+# Бюджет SQL-запросов на запрос (см. app/query_budget.py):
+# off — не считать, log — писать превышения и N+1 в лог, raise — отвечать 500
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "off")
+# Сколько одинаковых по форме запросов за один HTTP-запрос считается N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "3"))
@@ -9,13 +9,148 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
 
+import time
+import uuid
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.config import (
+    DB_ECHO,
+    DB_MAX_OVERFLOW,
+    DB_PGBOUNCER,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+    DATABASE_REPLICA_URLS,
+)
+from app import metrics, query_budget
+
 # Строка подключения для PostgreSQl
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set")
+# Прямое подключение к PostgreSQL в обход PgBouncer — для LISTEN/NOTIFY,
+# которому нужно сессионное соединение
+DATABASE_DIRECT_URL = os.getenv("DATABASE_DIRECT_URL") or DATABASE_URL
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, который считает, сколько запросы ждали свободное соединение.
+
+    checkout_count — все выдачи соединений; wait_count — только те, когда свободного
+    соединения не было, а открыть новое не позволял лимит пула (pool_size + max_overflow).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_count = 0
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        if self.checkedin() == 0 and self._max_overflow > -1 and self.overflow() >= self._max_overflow:
+            self.wait_count += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.checkout_count += 1
+            self.wait_seconds_total += elapsed
+            self.wait_seconds_max = max(self.wait_seconds_max, elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "max_overflow": self._max_overflow,
+            "timeout": self.timeout(),
+            "checkout_count": self.checkout_count,
+            "wait_count": self.wait_count,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "timeouts": self.timeouts,
+        }
+
+
+def _connect_args() -> dict:
+    if DB_PGBOUNCER:
+        # В transaction-режиме PgBouncer соседние транзакции попадают на разные
+        # серверные соединения, поэтому подготовленные запросы нельзя переиспользовать
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return {
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    }
+
+
+def _create_engine(url: str):
+    return create_async_engine(
+        url,
+        echo=DB_ECHO,
+        poolclass=InstrumentedAsyncPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=_connect_args(),
+    )
+
 
 # Создаём Engine
-async_engine = create_async_engine(DATABASE_URL, echo=True)
+async_engine = _create_engine(DATABASE_URL)
+# Реплики только для чтения (см. app/replicas.py)
+replica_engines = [_create_engine(url) for url in DATABASE_REPLICA_URLS]
+
+
+def _pool_samples(name: str, engine) -> list[tuple[str, tuple, float]]:
+    pool = engine.pool
+    labels = (("pool", name),)
+    return [
+        ("db_pool_connections", (*labels, ("state", "checked_out")), pool.checkedout()),
+        ("db_pool_connections", (*labels, ("state", "checked_in")), pool.checkedin()),
+        ("db_pool_connections", (*labels, ("state", "overflow")), max(pool.overflow(), 0)),
+        ("db_pool_checkouts_total", labels, pool.checkout_count),
+        ("db_pool_wait_total", labels, pool.wait_count),
+        ("db_pool_wait_seconds_total", labels, pool.wait_seconds_total),
+        ("db_pool_timeouts_total", labels, pool.timeouts),
+    ]
+
+
+def _collect_pool_metrics() -> list[tuple[str, tuple, float]]:
+    samples = _pool_samples("primary", async_engine)
+    for index, engine in enumerate(replica_engines):
+        samples += _pool_samples(f"replica{index}", engine)
+    return samples
+
+
+for engine in (async_engine, *replica_engines):
+    metrics.instrument_engine(engine)
+    query_budget.instrument_engine(engine)
+metrics.register_collector(_collect_pool_metrics)
+
+
+def pool_stats() -> dict:
+    """
+    Состояние пула соединений: занятые соединения, overflow и время ожидания.
+    """
+    return async_engine.pool.stats()
 
 # Настраиваем фабрику сеансов
 async_session_maker = async_sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
@@ -1,10 +1,33 @@
 from collections.abc import AsyncGenerator
+from fastapi import Request
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import async_session_maker
+from app.replicas import PRIMARY_PIN_COOKIE, replica_set
 
 async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
     """
     Предоставляет асинхронную сессию SQLAlchemy для работы с базой данных PostgreSQL.
     """
     async with async_session_maker() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+async def get_async_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Сессия только для чтения: с реплики (по кругу), если они настроены.
+    Клиент, который недавно сам что-то менял, читает с основной БД.
+    При ошибке соединения реплика временно исключается из ротации.
+    """
+    index = None if PRIMARY_PIN_COOKIE in request.cookies else replica_set.choose()
+    if index is None:
+        async with async_session_maker() as session:
+            yield session
+        return
+
+    async with replica_set.session_makers[index]() as session:
+        try:
+            yield session
+        except (DBAPIError, OSError) as exc:
+            if isinstance(exc, (OSError, OperationalError, InterfaceError)) or exc.connection_invalidated:
+                replica_set.eject(index)
+            raise
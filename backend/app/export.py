@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+from collections.abc import AsyncIterator, Mapping
+from datetime import datetime
+from decimal import Decimal
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import ColumnElement, Select, tuple_
+
+from app.config import EXPORT_CHUNK_SIZE
+from app.database import async_session_maker
+
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def _stream_chunks(
+    stmt: Select, keyset: Mapping[str, ColumnElement]
+) -> AsyncIterator[tuple[list[str], list]]:
+    """
+    Читает результат запроса порциями по EXPORT_CHUNK_SIZE строк с пагинацией по ключу:
+    строки упорядочены по столбцам keyset (имя в выборке → столбец), каждая следующая
+    порция начинается после последнего ключа предыдущей.
+
+    Каждая порция читается в своей короткой сессии, и соединение возвращается в пул
+    до отправки порции клиенту: медленный клиент не держит ни соединение, ни транзакцию.
+    Порции читаются из разных снимков БД, поэтому строки, изменённые во время
+    выгрузки, могут попасть в неё как в старом, так и в новом виде.
+    Следующая порция читается только после того, как клиент принял предыдущую,
+    поэтому память не растёт ни с размером выгрузки, ни у медленного клиента.
+    """
+    key_columns = list(keyset.values())
+    stmt = stmt.order_by(*key_columns).limit(EXPORT_CHUNK_SIZE)
+    last_key = None
+    while True:
+        batch = stmt if last_key is None else stmt.where(tuple_(*key_columns) > tuple_(*last_key))
+        async with async_session_maker() as session:
+            result = await session.execute(batch)
+            columns = list(result.keys())
+            rows = result.all()
+        if not rows:
+            return
+        yield columns, rows
+        if len(rows) < EXPORT_CHUNK_SIZE:
+            return
+        last_key = [rows[-1]._mapping[name] for name in keyset]
+
+
+async def _ndjson_lines(stmt: Select, keyset: Mapping[str, ColumnElement]) -> AsyncIterator[bytes]:
+    async for columns, rows in _stream_chunks(stmt, keyset):
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default) + "\n"
+            for row in rows
+        ).encode()
+
+
+async def _csv_lines(stmt: Select, keyset: Mapping[str, ColumnElement]) -> AsyncIterator[bytes]:
+    header_written = False
+    async for columns, rows in _stream_chunks(stmt, keyset):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+
+def export_response(
+    stmt: Select, keyset: Mapping[str, ColumnElement], export_format: str, filename: str
+) -> StreamingResponse:
+    """
+    Отдаёт результат запроса потоком в формате NDJSON или CSV.
+    keyset — уникальный ключ сортировки: имя столбца в выборке → столбец.
+    """
+    if export_format == "ndjson":
+        lines = _ndjson_lines(stmt, keyset)
+    else:
+        lines = _csv_lines(stmt, keyset)
+    return StreamingResponse(
+        lines,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
@@ -0,0 +1,44 @@
+"""
+Генерация уменьшенных WebP-вариантов изображений товаров.
+
+Модуль выполняется в процессах пула, поэтому не импортирует ничего из приложения.
+"""
+import os
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен — варианты не генерируются
+    Image = None
+
+
+# Имя варианта → максимальная сторона в пикселях
+IMAGE_VARIANTS = {"thumb": 200, "medium": 800}
+WEBP_QUALITY = 80
+
+
+def variant_name(file_name: str, variant: str) -> str:
+    return f"{Path(file_name).stem}_{variant}.webp"
+
+
+def render_variants(source_path: str) -> list[str]:
+    """
+    Создаёт недостающие варианты рядом с оригиналом и возвращает их имена.
+    """
+    source = Path(source_path)
+    created = []
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        for variant, size in IMAGE_VARIANTS.items():
+            target = source.with_name(variant_name(source.name, variant))
+            if target.exists():
+                continue
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+            temp_path = target.with_name(f".{target.name}.{os.getpid()}")
+            resized.save(temp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+            os.replace(temp_path, target)
+            created.append(target.name)
+    return created
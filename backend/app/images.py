@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import image_variants
+from app.config import IMAGE_UPLOAD_CONCURRENCY, IMAGE_UPLOAD_QUEUE_SIZE, IMAGE_VARIANT_WORKERS
+from app.models.products import Product
+
+
+logger = logging.getLogger(__name__)
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+MEDIA_ROOT = BASE_DIR / "media" / "products"
+MEDIA_ROOT.mkdir(parents=True, exist_ok=True)
+MEDIA_URL_PREFIX = "/media/products/"
+# Расширение файла определяется типом содержимого, а не именем загруженного файла
+ALLOWED_IMAGE_TYPES = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+# Имя файла, загруженного с адресацией по содержимому (sha256); только для них есть варианты
+_CONTENT_ADDRESSED_NAME = re.compile(r"^[0-9a-f]{64}\.(?:jpg|png|webp)$")
+MAX_IMAGE_SIZE = 2 * 1024 * 1024  # 2 097 152 байт
+# Предел тела запроса с изображением: файл плюс остальные поля формы и заголовки multipart
+MAX_IMAGE_REQUEST_SIZE = MAX_IMAGE_SIZE + 64 * 1024
+# Запросы с изображением товара: POST /api/products/ и PUT /api/products/{id}
+_IMAGE_UPLOAD_PATH = re.compile(r"^/api/products/(?:\d+)?$")
+_CHUNK_SIZE = 64 * 1024
+
+# Одновременно пишется не больше IMAGE_UPLOAD_CONCURRENCY файлов;
+# при переполнении очереди запрос сразу получает 503.
+_upload_workers = asyncio.Semaphore(IMAGE_UPLOAD_CONCURRENCY)
+_upload_slots = asyncio.Semaphore(IMAGE_UPLOAD_CONCURRENCY + IMAGE_UPLOAD_QUEUE_SIZE)
+
+# Пул процессов для генерации вариантов создаётся при первой загрузке изображения
+_variant_executor: ProcessPoolExecutor | None = None
+_variant_tasks: set[asyncio.Task] = set()
+_pending_variants: set[str] = set()
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def _spool_image(source: BinaryIO, extension: str) -> tuple[Path, str]:
+    """
+    Копирует загрузку порциями во временный файл, на лету считая sha256.
+    Возвращает временный файл и итоговое имя <sha256><ext>: одинаковые изображения
+    хранятся один раз. Выполняется в отдельном потоке.
+
+    К этому моменту Starlette уже принял тело запроса целиком; размер тела
+    ограничивает ImageUploadLimitMiddleware, а здесь проверяется размер самого файла.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    temp_path = MEDIA_ROOT / f".upload-{uuid.uuid4().hex}"
+    try:
+        with temp_path.open("wb") as target:
+            while chunk := source.read(_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_IMAGE_SIZE:
+                    raise ImageTooLarge
+                digest.update(chunk)
+                target.write(chunk)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return temp_path, f"{digest.hexdigest()}{extension}"
+
+
+class ImageUploadLimitMiddleware:
+    """
+    Ограничивает размер тела запросов с изображением товара до разбора формы:
+    при Content-Length больше MAX_IMAGE_REQUEST_SIZE сразу отвечает 413, не читая тело,
+    а без Content-Length (chunked) прерывает чтение, как только предел превышен.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("POST", "PUT")
+            or not _IMAGE_UPLOAD_PATH.match(scope["path"])
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > MAX_IMAGE_REQUEST_SIZE:
+            response = JSONResponse(
+                {"detail": "Request body is too large"},
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                headers={"Connection": "close"},
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_IMAGE_REQUEST_SIZE:
+                    # HTTPException из разбора формы FastAPI отдаёт как есть
+                    raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "Request body is too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def _lock_image(db: AsyncSession, file_name: str) -> None:
+    """
+    Блокировка имени файла до конца текущей транзакции. Сохранение и удаление файла
+    с одним содержимым выполняются под ней и не могут перемешаться.
+    """
+    await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(file_name))))
+
+
+async def save_product_image(db: AsyncSession, file: UploadFile) -> str:
+    """
+    Сохраняет изображение товара и возвращает относительный URL.
+
+    Файл появляется под блокировкой имени, которая держится до коммита ссылки
+    на него, поэтому параллельный remove_product_image его не удалит.
+    """
+    extension = ALLOWED_IMAGE_TYPES.get(file.content_type)
+    if extension is None:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Only JPG, PNG or WebP images are allowed")
+    if file.size is not None and file.size > MAX_IMAGE_SIZE:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Image is too large")
+
+    if _upload_slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, try again later",
+            headers={"Retry-After": "1"},
+        )
+    async with _upload_slots, _upload_workers:
+        await file.seek(0)
+        try:
+            temp_path, file_name = await asyncio.to_thread(_spool_image, file.file, extension)
+        except ImageTooLarge:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Image is too large")
+
+    try:
+        await _lock_image(db, file_name)
+        # Атомарная замена: файл с тем же именем имеет то же содержимое
+        await asyncio.to_thread(os.replace, temp_path, MEDIA_ROOT / file_name)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+    schedule_image_variants(file_name)
+    return f"{MEDIA_URL_PREFIX}{file_name}"
+
+
+def product_image_variants(url: str | None) -> dict[str, str] | None:
+    """
+    URL уменьшенных WebP-вариантов изображения. Имена вариантов выводятся из имени
+    оригинала без обращения к файловой системе; пока вариант не сгенерирован,
+    /media отдаёт по его URL оригинал (см. MediaFiles).
+    Для внешних URL и файлов со старыми (uuid) именами вариантов нет —
+    вместо них возвращается оригинал.
+    """
+    if not url:
+        return None
+    file_name = Path(url).name
+    if not url.startswith(MEDIA_URL_PREFIX) or not _CONTENT_ADDRESSED_NAME.match(file_name):
+        return {variant: url for variant in image_variants.IMAGE_VARIANTS}
+    return {
+        variant: f"{MEDIA_URL_PREFIX}{image_variants.variant_name(file_name, variant)}"
+        for variant in image_variants.IMAGE_VARIANTS
+    }
+
+
+def schedule_image_variants(file_name: str) -> None:
+    """
+    Ставит генерацию вариантов изображения в фоновый пул процессов.
+    Уже существующие варианты render_variants пропускает.
+    """
+    if image_variants.Image is None or IMAGE_VARIANT_WORKERS <= 0:
+        return
+    if file_name in _pending_variants:
+        return
+    _pending_variants.add(file_name)
+    task = asyncio.create_task(_generate_variants(file_name))
+    _variant_tasks.add(task)
+    task.add_done_callback(_variant_tasks.discard)
+
+
+def _get_variant_executor() -> ProcessPoolExecutor:
+    global _variant_executor
+    if _variant_executor is None:
+        # spawn: дочерние процессы не наследуют event loop и потоки воркера
+        _variant_executor = ProcessPoolExecutor(
+            max_workers=IMAGE_VARIANT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _variant_executor
+
+
+async def _generate_variants(file_name: str) -> None:
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(
+            _get_variant_executor(), image_variants.render_variants, str(MEDIA_ROOT / file_name)
+        )
+    except BrokenProcessPool:
+        # Процесс пула упал (например, на повреждённом файле) — пересоздадим пул
+        global _variant_executor
+        _variant_executor = None
+        logger.exception("Image variant worker crashed on %s", file_name)
+        return
+    except Exception:
+        logger.exception("Failed to render image variants for %s", file_name)
+        return
+    finally:
+        _pending_variants.discard(file_name)
+
+
+def shutdown_image_workers() -> None:
+    """
+    Останавливает генерацию вариантов при завершении воркера.
+    """
+    for task in _variant_tasks:
+        task.cancel()
+    if _variant_executor is not None:
+        _variant_executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def remove_product_image(db: AsyncSession, url: str | None) -> None:
+    """
+    Удаляет файл изображения, если на него больше не ссылается ни один активный товар.
+    Вызывается после коммита изменения товара.
+
+    Ссылки считаются под блокировкой имени файла: загрузка того же содержимого,
+    ещё не закоммиченная другим запросом, дождётся удаления и запишет файл заново.
+    """
+    if not url or not url.startswith(MEDIA_URL_PREFIX):
+        return
+    file_name = Path(url).name
+    await _lock_image(db, file_name)
+    references = await db.scalar(
+        select(func.count()).where(Product.image_url == url, Product.is_active == True)
+    )
+    if not references:
+        names = [file_name] + [
+            image_variants.variant_name(file_name, variant) for variant in image_variants.IMAGE_VARIANTS
+        ]
+        await asyncio.to_thread(_unlink_files, names)
+    # Транзакция только держала блокировку; коммит её снимает
+    await db.commit()
+
+
+def _unlink_files(names: list[str]) -> None:
+    for name in names:
+        (MEDIA_ROOT / name).unlink(missing_ok=True)
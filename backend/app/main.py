@@ -1,16 +1,50 @@
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi import FastAPI
-from app.routers import categories, products, users, cart, orders
-from fastapi.staticfiles import StaticFiles
+from app.routers import categories, products, users, cart, orders, internal
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
 
+from app.config import AUTH_STATELESS, CHANGE_FEED_ENABLED, METRICS_DIR
+from app.revocation import run_revocation_refresher
+from app.change_feed import run_change_listener
+from app.images import MEDIA_ROOT, ImageUploadLimitMiddleware, shutdown_image_workers
+from app.media import MediaFiles
+from app.replicas import ReadYourWritesMiddleware
+from app.metrics import MetricsMiddleware, run_metrics_flusher
+from app.query_budget import QueryBudgetMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Запускает фоновые задачи воркера и останавливает их при завершении.
+    """
+    background_tasks = []
+    if CHANGE_FEED_ENABLED:
+        background_tasks.append(asyncio.create_task(run_change_listener()))
+    if AUTH_STATELESS:
+        background_tasks.append(asyncio.create_task(run_revocation_refresher()))
+    if METRICS_DIR:
+        background_tasks.append(asyncio.create_task(run_metrics_flusher()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    shutdown_image_workers()
+
 
 app = FastAPI(title="Ecommerce FastAPI",
-              version="0.1.0")
+              version="0.1.0",
+              lifespan=lifespan)
 
 load_dotenv() 
 
+app.add_middleware(ImageUploadLimitMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(QueryBudgetMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -30,9 +64,11 @@ app.include_router(products.router)
 app.include_router(users.router)
 app.include_router(cart.router)
 app.include_router(orders.router)
+app.include_router(internal.router)
+app.include_router(internal.metrics_router)
 
 # Монтируем медиа-файлы
-app.mount("/media", StaticFiles(directory="media"), name="media")
+app.mount("/media", MediaFiles(directory=MEDIA_ROOT.parent), name="media")
 
 @app.get("/api/")
 async def root():
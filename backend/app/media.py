@@ -0,0 +1,114 @@
+import os
+import re
+import stat
+from pathlib import Path
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.cache import TTLCache
+from app.image_variants import IMAGE_VARIANTS
+from app.config import (
+    MEDIA_HOT_CACHE_ENTRIES,
+    MEDIA_HOT_CACHE_FILE_SIZE,
+    MEDIA_HOT_CACHE_TTL,
+    MEDIA_IMMUTABLE_MAX_AGE,
+    MEDIA_MAX_AGE,
+)
+from app.images import ALLOWED_IMAGE_TYPES
+
+
+# <sha256>.<ext> и варианты <sha256>_<variant>.webp: содержимое по такому имени не меняется
+_CONTENT_HASHED_NAME = re.compile(r"^[0-9a-f]{64}(_[a-z]+)?\.[a-z0-9]+$")
+_VARIANT_NAME = re.compile(r"^(?P<digest>[0-9a-f]{64})_(?P<variant>[a-z]+)\.webp$")
+
+
+class MediaFiles(StaticFiles):
+    """
+    Раздача загруженных файлов.
+
+    Поверх StaticFiles (ETag/Last-Modified, 304, Range и http.response.pathsend
+    для zero-copy отправки, если сервер его поддерживает):
+    - файлы с контентным хэшем в имени отдаются с Cache-Control: immutable на год,
+      остальные — с коротким max-age;
+    - небольшие часто запрашиваемые файлы держатся в памяти воркера, чтобы не
+      ходить в файловую систему на каждый запрос;
+    - пока вариант изображения не сгенерирован, по его URL отдаётся оригинал.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._hot_files = TTLCache(maxsize=MEDIA_HOT_CACHE_ENTRIES, ttl=MEDIA_HOT_CACHE_TTL)
+
+    def file_response(
+        self,
+        full_path: os.PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        # Заголовок нужен и в 304: NotModifiedResponse его сохраняет
+        response.headers["Cache-Control"] = _cache_control(Path(full_path).name)
+        return response
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        request_headers = Headers(scope=scope)
+        # Диапазоны и HEAD отдаёт StaticFiles, из памяти — только полные GET
+        cacheable = scope["method"] == "GET" and "range" not in request_headers
+        if cacheable:
+            cached = self._hot_files.get(path)
+            if cached is not None:
+                body, headers = cached
+                if self.is_not_modified(headers, request_headers):
+                    return NotModifiedResponse(headers)
+                return Response(body, headers=headers)
+
+        try:
+            response = await super().get_response(path, scope)
+        except HTTPException as exc:
+            if exc.status_code != 404:
+                raise
+            response = await self._variant_fallback(path, scope)
+            if response is None:
+                raise
+            return response
+        if (
+            cacheable
+            and isinstance(response, FileResponse)
+            and response.status_code == 200
+            and response.stat_result is not None
+            and response.stat_result.st_size <= MEDIA_HOT_CACHE_FILE_SIZE
+        ):
+            body = await anyio.to_thread.run_sync(Path(response.path).read_bytes)
+            headers = dict(response.headers)
+            self._hot_files.set(path, (body, headers))
+            return Response(body, headers=headers)
+        return response
+
+    async def _variant_fallback(self, path: str, scope: Scope) -> Response | None:
+        match = _VARIANT_NAME.match(Path(path).name)
+        if match is None or match["variant"] not in IMAGE_VARIANTS:
+            return None
+        for extension in ALLOWED_IMAGE_TYPES.values():
+            original = str(Path(path).with_name(match["digest"] + extension))
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, original)
+            if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+                response = self.file_response(full_path, stat_result, scope)
+                # Вариант скоро появится по этому же URL — не даём закэшировать оригинал
+                response.headers["Cache-Control"] = "no-cache"
+                return response
+        return None
+
+    def hot_cache_stats(self) -> dict:
+        return self._hot_files.stats()
+
+
+def _cache_control(file_name: str) -> str:
+    if _CONTENT_HASHED_NAME.match(file_name):
+        return f"public, max-age={MEDIA_IMMUTABLE_MAX_AGE}, immutable"
+    return f"public, max-age={MEDIA_MAX_AGE}"
@@ -0,0 +1,274 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from collections.abc import Callable
+from pathlib import Path
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import METRICS_DIR, METRICS_FLUSH_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Описание метрик: имя → (тип, справка)
+METRICS = {
+    "http_requests_total": ("counter", "HTTP-запросы по маршруту, методу и статусу"),
+    "http_request_duration_seconds": ("histogram", "Время обработки HTTP-запроса"),
+    "db_queries_total": ("counter", "SQL-запросы по маршруту"),
+    "db_query_duration_seconds_total": ("counter", "Суммарное время SQL-запросов по маршруту"),
+    "db_pool_connections": ("gauge", "Соединения пула по состоянию (checked_out, checked_in, overflow)"),
+    "db_pool_checkouts_total": ("counter", "Сколько раз запрашивалось соединение из пула"),
+    "db_pool_wait_total": ("counter", "Сколько раз свободного соединения не было и пришлось ждать"),
+    "db_pool_wait_seconds_total": ("counter", "Суммарное ожидание соединения из пула"),
+    "db_pool_timeouts_total": ("counter", "Таймауты ожидания соединения из пула"),
+    "password_hash_duration_seconds": ("histogram", "Время bcrypt-операции в пуле потоков"),
+    "password_hash_in_flight": ("gauge", "bcrypt-операции в работе и в очереди"),
+    "password_hash_rejected_total": ("counter", "bcrypt-операции, отклонённые из-за переполнения очереди"),
+    "checkout_total": ("counter", "Оформления заказа по результату"),
+}
+
+# Счётчики и гистограммы воркера. Меняются только из event loop, поэтому без блокировок.
+# Ключ — (имя, метки в виде кортежа пар).
+_counters: dict[tuple[str, tuple], float] = {}
+_histograms: dict[tuple[str, tuple], list] = {}
+# Функции, которые при снятии метрик возвращают текущие значения [(имя, метки, значение)]
+_collectors: list[Callable[[], list[tuple[str, tuple, float]]]] = []
+
+
+def inc(name: str, labels: tuple = (), value: float = 1) -> None:
+    key = (name, labels)
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, labels: tuple, value: float) -> None:
+    key = (name, labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+    histogram[0][bisect_left(LATENCY_BUCKETS, value)] += 1
+    histogram[1] += value
+    histogram[2] += 1
+
+
+def register_collector(collector: Callable[[], list[tuple[str, tuple, float]]]) -> None:
+    _collectors.append(collector)
+
+
+# Статистика текущего запроса: [число SQL-запросов, время в БД]
+_request_db_stats: contextvars.ContextVar[list | None] = contextvars.ContextVar(
+    "request_db_stats", default=None
+)
+
+
+def instrument_engine(engine) -> None:
+    """
+    Подписывается на события выполнения запросов движка и относит
+    их число и время к текущему HTTP-запросу.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _request_db_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += time.perf_counter() - context._metrics_started
+
+
+class MetricsMiddleware:
+    """
+    Считает запросы, их длительность и SQL-запросы по шаблону маршрута.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        db_stats = [0, 0.0]
+        token = _request_db_stats.set(db_stats)
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_db_stats.reset(token)
+            # Шаблон маршрута вместо пути, чтобы не плодить метки по ID
+            route = getattr(scope.get("route"), "path", None) or "other"
+            method = scope["method"]
+            inc("http_requests_total", (("method", method), ("route", route), ("status", str(status_code))))
+            observe("http_request_duration_seconds", (("method", method), ("route", route)), elapsed)
+            if db_stats[0]:
+                inc("db_queries_total", (("route", route),), db_stats[0])
+                inc("db_query_duration_seconds_total", (("route", route),), db_stats[1])
+
+
+def _snapshot() -> dict:
+    gauges = []
+    counters = [[name, list(labels), value] for (name, labels), value in _counters.items()]
+    for collector in _collectors:
+        for name, labels, value in collector():
+            target = gauges if METRICS[name][0] == "gauge" else counters
+            target.append([name, list(labels), value])
+    return {
+        "pid": os.getpid(),
+        # Воркеры одного запуска сервиса — дети одного мастер-процесса
+        "ppid": os.getppid(),
+        "counters": counters,
+        "gauges": gauges,
+        "histograms": [
+            [name, list(labels), buckets, total, count]
+            for (name, labels), (buckets, total, count) in _histograms.items()
+        ],
+    }
+
+
+def _snapshot_path(pid: int) -> Path:
+    return Path(METRICS_DIR) / f"worker-{pid}.json"
+
+
+def _write_snapshot(snapshot: dict) -> None:
+    path = _snapshot_path(snapshot["pid"])
+    temp_path = path.with_suffix(".tmp")
+    temp_path.write_text(json.dumps(snapshot))
+    os.replace(temp_path, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _load_snapshots() -> list[tuple[Path, dict | None]]:
+    snapshots = []
+    for path in Path(METRICS_DIR).glob("worker-*.json"):
+        try:
+            snapshots.append((path, json.loads(path.read_text())))
+        except (OSError, ValueError):
+            snapshots.append((path, None))
+    return snapshots
+
+
+def _remove_stale_snapshots() -> None:
+    """
+    Удаляет снимки предыдущих запусков сервиса, чтобы их счётчики не суммировались в /metrics.
+    """
+    ppid = os.getppid()
+    for path, snapshot in _load_snapshots():
+        if snapshot is not None and snapshot.get("ppid") != ppid:
+            path.unlink(missing_ok=True)
+
+
+def _read_snapshots(own: dict) -> list[dict]:
+    """
+    Снимки всех воркеров текущего запуска из METRICS_DIR; свой — всегда свежий из памяти.
+    Счётчики завершившихся воркеров сохраняются, их текущие значения (gauge) — нет.
+    """
+    snapshots = [own]
+    if not METRICS_DIR:
+        return snapshots
+    for path, snapshot in _load_snapshots():
+        if snapshot is None or snapshot["pid"] == own["pid"] or snapshot.get("ppid") != own["ppid"]:
+            continue
+        if not _pid_alive(snapshot["pid"]):
+            snapshot["gauges"] = []
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _render(snapshots: list[dict]) -> str:
+    values: dict[str, dict[tuple, float]] = {}
+    histograms: dict[str, dict[tuple, list]] = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"] + snapshot["gauges"]:
+            series = values.setdefault(name, {})
+            key = tuple(map(tuple, labels))
+            series[key] = series.get(key, 0) + value
+        for name, labels, buckets, total, count in snapshot["histograms"]:
+            series = histograms.setdefault(name, {})
+            key = tuple(map(tuple, labels))
+            current = series.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            current[0] = [a + b for a, b in zip(current[0], buckets)]
+            current[1] += total
+            current[2] += count
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        if name not in values and name not in histograms:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in sorted(values.get(name, {}).items()):
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for labels, (buckets, total, count) in sorted(histograms.get(name, {}).items()):
+            cumulative = 0
+            for bound, bucket in zip((*LATENCY_BUCKETS, "+Inf"), buckets):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{_format_labels((*labels, ('le', str(bound))))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+async def render_metrics() -> str:
+    """
+    Метрики всех воркеров в текстовом формате Prometheus.
+    """
+    snapshots = await asyncio.to_thread(_read_snapshots, _snapshot())
+    return _render(snapshots)
+
+
+async def run_metrics_flusher() -> None:
+    """
+    Фоновая задача воркера: периодически сохраняет снимок метрик в METRICS_DIR,
+    откуда их собирает /metrics любого воркера.
+    """
+    Path(METRICS_DIR).mkdir(parents=True, exist_ok=True)
+    try:
+        await asyncio.to_thread(_remove_stale_snapshots)
+    except OSError:
+        logger.exception("Failed to remove stale metrics snapshots")
+    while True:
+        try:
+            await asyncio.to_thread(_write_snapshot, _snapshot())
+        except OSError:
+            logger.exception("Failed to write metrics snapshot")
+        await asyncio.sleep(METRICS_FLUSH_SECONDS)
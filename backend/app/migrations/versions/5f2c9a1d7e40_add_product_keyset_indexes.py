@@ -0,0 +1,38 @@
+"""add product keyset indexes
+
+Revision ID: 5f2c9a1d7e40
+Revises: fix_image_url_nullable
+Create Date: 2026-10-18 10:12:41.503218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f2c9a1d7e40'
+down_revision: Union[str, Sequence[str], None] = 'fix_image_url_nullable'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_products_active_price_id', 'products', ['price', 'id'],
+                    unique=False, postgresql_where=sa.text('is_active'))
+    op.create_index('ix_products_active_category_id', 'products', ['category_id', 'id'],
+                    unique=False, postgresql_where=sa.text('is_active'))
+    op.create_index('ix_products_active_category_price_id', 'products', ['category_id', 'price', 'id'],
+                    unique=False, postgresql_where=sa.text('is_active'))
+    op.create_index('ix_products_active_seller_id', 'products', ['seller_id', 'id'],
+                    unique=False, postgresql_where=sa.text('is_active'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_active_seller_id', table_name='products')
+    op.drop_index('ix_products_active_category_price_id', table_name='products')
+    op.drop_index('ix_products_active_category_id', table_name='products')
+    op.drop_index('ix_products_active_price_id', table_name='products')
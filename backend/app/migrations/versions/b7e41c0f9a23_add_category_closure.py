@@ -0,0 +1,73 @@
+"""add category closure table
+
+Revision ID: b7e41c0f9a23
+Revises: 5f2c9a1d7e40
+Create Date: 2026-10-18 11:03:27.118604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e41c0f9a23'
+down_revision: Union[str, Sequence[str], None] = '5f2c9a1d7e40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('category_closure',
+    sa.Column('ancestor_id', sa.Integer(), nullable=False),
+    sa.Column('descendant_id', sa.Integer(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['categories.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['descendant_id'], ['categories.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index(op.f('ix_category_closure_descendant_id'), 'category_closure', ['descendant_id'], unique=False)
+
+    # Рекурсивное заполнение ниже не завершится, если parent_id образуют цикл,
+    # поэтому сначала ищем цикл, поднимаясь от каждой категории к корню
+    cycle = op.get_bind().execute(sa.text("""
+        WITH RECURSIVE walk AS (
+            SELECT id AS start_id, parent_id, ARRAY[id] AS path, false AS is_cycle
+            FROM categories
+            UNION ALL
+            SELECT walk.start_id, categories.parent_id, walk.path || categories.id,
+                   categories.id = ANY(walk.path)
+            FROM walk
+            JOIN categories ON categories.id = walk.parent_id
+            WHERE NOT walk.is_cycle
+        )
+        SELECT path FROM walk WHERE is_cycle ORDER BY start_id LIMIT 1
+    """)).first()
+    if cycle is not None:
+        raise RuntimeError(
+            "categories.parent_id contains a cycle: "
+            + " -> ".join(str(category_id) for category_id in cycle.path)
+            + "; fix parent_id of these categories and rerun the migration"
+        )
+
+    # Заполняем замыкание для уже существующего дерева
+    op.execute("""
+        INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE tree AS (
+            SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth
+            FROM categories
+            UNION ALL
+            SELECT tree.ancestor_id, categories.id, tree.depth + 1
+            FROM tree
+            JOIN categories ON categories.parent_id = tree.descendant_id
+        )
+        SELECT ancestor_id, descendant_id, depth FROM tree
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_category_closure_descendant_id'), table_name='category_closure')
+    op.drop_table('category_closure')
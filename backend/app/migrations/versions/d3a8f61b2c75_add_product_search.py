@@ -0,0 +1,42 @@
+"""add product full-text and trigram search
+
+Revision ID: d3a8f61b2c75
+Revises: b7e41c0f9a23
+Create Date: 2026-10-18 14:26:09.842117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a8f61b2c75'
+down_revision: Union[str, Sequence[str], None] = 'b7e41c0f9a23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("""
+        ALTER TABLE products
+        ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            to_tsvector('russian', coalesce(name, '') || ' ' || coalesce(description, ''))
+        ) STORED
+    """)
+    op.create_index('ix_products_search_vector', 'products', ['search_vector'],
+                    unique=False, postgresql_using='gin')
+    op.create_index('ix_products_name_trgm', 'products', ['name'],
+                    unique=False, postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_name_trgm', table_name='products')
+    op.drop_index('ix_products_search_vector', table_name='products')
+    op.drop_column('products', 'search_vector')
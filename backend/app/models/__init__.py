@@ -1,7 +1,9 @@
 from .categories import Category
+from .category_closure import CategoryClosure
 from .products import Product
 from .users import User
 from .cart_items import CartItem
 from .orders import Order, OrderItem
+from .product_import_jobs import ProductImportJob
 
-__all__ = ["Category", "Product", "User", "CartItem", "Order", "OrderItem"]
\ No newline at end of file
+__all__ = ["Category", "CategoryClosure", "Product", "User", "CartItem", "Order", "OrderItem", "ProductImportJob"]
\ No newline at end of file
@@ -0,0 +1,20 @@
+from sqlalchemy import ForeignKey, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class CategoryClosure(Base):
+    """
+    Таблица замыкания дерева категорий: по строке на каждую пару
+    «предок — потомок» (включая саму категорию с depth = 0).
+    """
+    __tablename__ = "category_closure"
+
+    ancestor_id: Mapped[int] = mapped_column(
+        ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True
+    )
+    descendant_id: Mapped[int] = mapped_column(
+        ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True, index=True
+    )
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -1,4 +1,5 @@
-from sqlalchemy import String, Boolean, Integer, ForeignKey, Numeric
+from sqlalchemy import String, Boolean, Integer, ForeignKey, Numeric, Index, text, Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship  
 from decimal import Decimal
 
@@ -10,6 +11,22 @@ class Product(Base):
     """
     __tablename__="products"
 
+    # Частичные составные индексы под сортировки и keyset-пагинацию каталога
+    __table_args__ = (
+        Index("ix_products_active_price_id", "price", "id",
+              postgresql_where=text("is_active")),
+        Index("ix_products_active_category_id", "category_id", "id",
+              postgresql_where=text("is_active")),
+        Index("ix_products_active_category_price_id", "category_id", "price", "id",
+              postgresql_where=text("is_active")),
+        Index("ix_products_active_seller_id", "seller_id", "id",
+              postgresql_where=text("is_active")),
+        # Полнотекстовый и нечёткий (pg_trgm) поиск
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_products_name_trgm", "name", postgresql_using="gin",
+              postgresql_ops={"name": "gin_trgm_ops"}),
+    )
+
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(50), nullable=False)
     description: Mapped[str | None] = mapped_column(String(100), nullable=False)
@@ -25,17 +42,26 @@ class Product(Base):
     )
     seller = relationship("User", back_populates="products")  
     seller_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    search_vector: Mapped[str | None] = mapped_column(
+        TSVECTOR,
+        Computed("to_tsvector('russian', coalesce(name, '') || ' ' || coalesce(description, ''))",
+                 persisted=True),
+        deferred=True,
+    )
 
     cart_items: Mapped[list["CartItem"]] = relationship("CartItem", back_populates="product", cascade="all, delete-orphan")
 
     order_items: Mapped[list["OrderItem"]] = relationship("OrderItem", back_populates="product")
 
 
-
-
-
-
-
-
-
-
+# Колонки, из которых собирается ProductResponce (без служебного search_vector)
+PRODUCT_RESPONSE_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.description,
+    Product.price,
+    Product.image_url,
+    Product.stock,
+    Product.category_id,
+    Product.is_active,
+)
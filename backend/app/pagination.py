@@ -0,0 +1,85 @@
+import base64
+import binascii
+import json
+from decimal import Decimal, InvalidOperation
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+from app.models.products import Product
+
+
+# Допустимые сортировки списка товаров. Каждой соответствует составной индекс
+# (см. Product.__table_args__), поэтому выборка по курсору идёт по индексу.
+PRODUCT_SORTS = ("id", "price_asc", "price_desc", "newest")
+
+
+def product_order_by(sort: str) -> list:
+    """
+    Возвращает выражения ORDER BY для выбранной сортировки товаров.
+    Последним ключом всегда идёт Product.id — это делает порядок однозначным.
+    """
+    if sort == "price_asc":
+        return [Product.price.asc(), Product.id.asc()]
+    if sort == "price_desc":
+        return [Product.price.desc(), Product.id.desc()]
+    if sort == "newest":
+        return [Product.id.desc()]
+    return [Product.id.asc()]
+
+
+def product_cursor_key(sort: str, product) -> list:
+    """
+    Значения ключа сортировки последнего товара страницы.
+    """
+    if sort in ("price_asc", "price_desc"):
+        return [str(product.price), product.id]
+    return [product.id]
+
+
+def product_cursor_filter(sort: str, key: list):
+    """
+    Условие «строго после курсора» для выбранной сортировки (keyset-пагинация).
+    """
+    try:
+        if sort in ("price_asc", "price_desc"):
+            price, last_id = Decimal(key[0]), int(key[1])
+            if sort == "price_asc":
+                return tuple_(Product.price, Product.id) > tuple_(price, last_id)
+            return tuple_(Product.price, Product.id) < tuple_(price, last_id)
+        last_id = int(key[0])
+    except (IndexError, TypeError, ValueError, InvalidOperation):
+        raise _invalid_cursor()
+    if sort == "newest":
+        return Product.id < last_id
+    return Product.id > last_id
+
+
+def encode_cursor(sort: str, key: list) -> str:
+    """
+    Упаковывает сортировку и ключ последней строки в непрозрачную строку.
+    """
+    raw = json.dumps({"s": sort, "k": key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> list:
+    """
+    Распаковывает курсор и проверяет, что он выдан для той же сортировки.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        cursor_sort, key = data["s"], data["k"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise _invalid_cursor()
+    if cursor_sort != sort or not isinstance(key, list):
+        raise _invalid_cursor()
+    return key
+
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Некорректный курсор пагинации",
+    )
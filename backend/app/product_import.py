@@ -0,0 +1,238 @@
+import asyncio
+import csv
+import json
+import logging
+from collections.abc import Iterator
+from decimal import Decimal
+from itertools import islice
+from pathlib import Path
+from typing import BinaryIO
+
+from pydantic import ValidationError
+from sqlalchemy import column, func, insert, literal, select, table, text, true, update
+
+from app.cache import invalidate
+from app.change_feed import publish_change
+from app.config import PRODUCT_IMPORT_BATCH_SIZE, PRODUCT_IMPORT_MAX_ERRORS
+from app.database import async_session_maker
+from app.models.categories import Category
+from app.models.product_import_jobs import ProductImportJob
+from app.models.products import Product
+from app.schemas import ProductCreate
+
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FIELDS = ("name", "description", "price", "stock", "category_id")
+
+# Ограничения колонок таблицы products, которые строже ProductCreate
+_NAME_MAX_LENGTH = Product.__table__.c.name.type.length
+_DESCRIPTION_MAX_LENGTH = Product.__table__.c.description.type.length
+_PRICE_LIMIT = Decimal(10) ** (
+    Product.__table__.c.price.type.precision - Product.__table__.c.price.type.scale
+)
+
+# Временная таблица живёт до конца транзакции импорта
+_STAGING_DDL = f"""
+    CREATE TEMP TABLE product_import_staging (
+        row_no integer NOT NULL,
+        name varchar({_NAME_MAX_LENGTH}) NOT NULL,
+        description varchar({_DESCRIPTION_MAX_LENGTH}) NOT NULL,
+        price numeric(10, 2) NOT NULL,
+        stock integer NOT NULL,
+        category_id integer NOT NULL
+    ) ON COMMIT DROP
+"""
+_STAGING_COLUMNS = ("row_no", *IMPORT_FIELDS)
+_staging = table("product_import_staging", *(column(name) for name in _STAGING_COLUMNS))
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+class ImportTooLarge(Exception):
+    pass
+
+
+def spool_upload(source: BinaryIO, path: Path, max_bytes: int) -> int:
+    """
+    Копирует загруженный файл во временный файл на диске порциями.
+    Вызывается в отдельном потоке; возвращает размер файла.
+    """
+    size = 0
+    with path.open("wb") as target:
+        while chunk := source.read(_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise ImportTooLarge
+            target.write(chunk)
+    return size
+
+
+def _read_rows(path: Path, import_format: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """
+    Построчно читает CSV или NDJSON: (номер строки, данные, ошибка разбора).
+    """
+    with path.open(encoding="utf-8-sig", newline="") as source:
+        if import_format == "csv":
+            for row_no, row in enumerate(csv.DictReader(source), start=1):
+                yield row_no, row, None
+            return
+        for row_no, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                yield row_no, None, "Строка не является корректным JSON"
+                continue
+            if not isinstance(data, dict):
+                yield row_no, None, "Строка должна быть JSON-объектом"
+                continue
+            yield row_no, data, None
+
+
+def _validate_row(data: dict, category_ids: set[int]) -> tuple | list[str]:
+    """
+    Проверяет строку по правилам ProductCreate и ограничениям колонок.
+    Возвращает запись для COPY или список ошибок.
+    """
+    values = {
+        field: data[field]
+        for field in IMPORT_FIELDS
+        if data.get(field) not in (None, "")
+    }
+    try:
+        product = ProductCreate.model_validate(values)
+    except ValidationError as exc:
+        return [
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+            for error in exc.errors()
+        ]
+
+    description = product.description or ""
+    problems = []
+    if len(product.name) > _NAME_MAX_LENGTH:
+        problems.append(f"name: не длиннее {_NAME_MAX_LENGTH} символов")
+    if len(description) > _DESCRIPTION_MAX_LENGTH:
+        problems.append(f"description: не длиннее {_DESCRIPTION_MAX_LENGTH} символов")
+    if product.price >= _PRICE_LIMIT:
+        problems.append(f"price: должна быть меньше {_PRICE_LIMIT}")
+    if product.category_id not in category_ids:
+        problems.append(f"category_id: категория {product.category_id} не существует или неактивна")
+    if problems:
+        return problems
+    return product.name, description, product.price, product.stock, product.category_id
+
+
+def _next_batch(rows: Iterator, category_ids: set[int]) -> tuple[int, list[tuple], list[dict]] | None:
+    """
+    Читает и проверяет следующую пачку строк. Вызывается в отдельном потоке,
+    чтобы разбор и валидация не блокировали event loop.
+    """
+    batch = list(islice(rows, PRODUCT_IMPORT_BATCH_SIZE))
+    if not batch:
+        return None
+    records, errors = [], []
+    for row_no, data, error in batch:
+        result = [error] if error is not None else _validate_row(data, category_ids)
+        if isinstance(result, list):
+            errors.append({"row": row_no, "errors": result})
+        else:
+            records.append((row_no, *result))
+    return len(batch), records, errors
+
+
+async def _update_job(job_id: int, **values) -> None:
+    # Статус пишется отдельной короткой транзакцией, чтобы прогресс был виден сразу
+    async with async_session_maker() as db:
+        await db.execute(
+            update(ProductImportJob).where(ProductImportJob.id == job_id).values(**values)
+        )
+        await db.commit()
+
+
+async def _load_products(job_id: int, path: Path, import_format: str, seller_id: int) -> dict:
+    """
+    Загружает корректные строки во временную таблицу через COPY
+    и одним INSERT ... SELECT переносит их в products.
+    Все товары файла появляются в каталоге одной транзакцией.
+    """
+    total_rows = error_count = 0
+    errors: list[dict] = []
+    rows = _read_rows(path, import_format)
+    try:
+        async with async_session_maker() as db:
+            # Активные категории загружаются один раз на весь файл
+            category_ids = set(await db.scalars(select(Category.id).where(Category.is_active == True)))
+            await db.execute(text(_STAGING_DDL))
+            connection = await db.connection()
+            raw_connection = await connection.get_raw_connection()
+            driver_connection = raw_connection.driver_connection
+
+            while (batch := await asyncio.to_thread(_next_batch, rows, category_ids)) is not None:
+                batch_rows, records, batch_errors = batch
+                total_rows += batch_rows
+                error_count += len(batch_errors)
+                errors.extend(batch_errors[:PRODUCT_IMPORT_MAX_ERRORS - len(errors)])
+                if records:
+                    await driver_connection.copy_records_to_table(
+                        "product_import_staging", records=records, columns=_STAGING_COLUMNS
+                    )
+                await _update_job(job_id, total_rows=total_rows, error_count=error_count)
+
+            merge_stmt = insert(Product).from_select(
+                ["name", "description", "price", "stock", "category_id", "is_active", "seller_id"],
+                select(
+                    _staging.c.name,
+                    _staging.c.description,
+                    _staging.c.price,
+                    _staging.c.stock,
+                    _staging.c.category_id,
+                    true(),
+                    literal(seller_id),
+                ).order_by(_staging.c.row_no),
+            )
+            imported_rows = (await db.execute(merge_stmt)).rowcount
+            if imported_rows:
+                await publish_change(db, "products", None)
+            await db.commit()
+    finally:
+        rows.close()
+
+    if imported_rows:
+        invalidate("products")
+    return {
+        "total_rows": total_rows,
+        "imported_rows": imported_rows,
+        "error_count": error_count,
+        "errors": errors,
+    }
+
+
+async def run_import(job_id: int, path: Path, import_format: str, seller_id: int) -> None:
+    """
+    Выполняет задачу импорта и записывает её итог. Временный файл удаляется.
+    """
+    try:
+        await _update_job(job_id, status="running")
+        report = await _load_products(job_id, path, import_format, seller_id)
+    except (ValueError, csv.Error) as exc:
+        # Файл не читается целиком (кодировка, битый CSV) — ничего не загружено
+        await _update_job(
+            job_id,
+            status="failed",
+            errors=[{"row": 0, "errors": [f"Не удалось прочитать файл: {exc}"]}],
+            finished_at=func.now(),
+        )
+    except Exception:
+        logger.exception("Product import job %s failed", job_id)
+        await _update_job(
+            job_id,
+            status="failed",
+            errors=[{"row": 0, "errors": ["Внутренняя ошибка импорта"]}],
+            finished_at=func.now(),
+        )
+    else:
+        await _update_job(job_id, status="done", finished_at=func.now(), **report)
+    finally:
+        path.unlink(missing_ok=True)
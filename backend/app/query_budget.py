@@ -0,0 +1,155 @@
+import contextvars
+import json
+import logging
+import re
+from collections import Counter
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import QUERY_BUDGET_MODE, QUERY_REPEAT_THRESHOLD
+
+
+logger = logging.getLogger(__name__)
+
+# Текущий режим; тесты включают его через app.testing
+mode = QUERY_BUDGET_MODE
+repeat_threshold = QUERY_REPEAT_THRESHOLD
+
+# Плейсхолдеры asyncpg вида $1::INTEGER; развёрнутые списки IN (...) сворачиваются в один
+_PLACEHOLDER = re.compile(r"\$\d+(?:::[A-Z][A-Z0-9_]*(?:\(\d+(?:, ?\d+)?\))?)?")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:, \?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def query_budget(max_queries: int):
+    """
+    Объявляет для обработчика максимальное число SQL-запросов на один HTTP-запрос.
+    Ставится под декоратором маршрута:
+
+        @router.get("/{product_id}")
+        @query_budget(2)
+        async def get_product(...): ...
+    """
+    def decorator(endpoint):
+        endpoint.__query_budget__ = max_queries
+        return endpoint
+    return decorator
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Форма запроса без значений параметров: по ней группируются повторы (N+1).
+    """
+    shape = _PLACEHOLDER.sub("?", statement)
+    shape = _PLACEHOLDER_LIST.sub("?", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class QueryLog:
+    """
+    SQL-запросы одного HTTP-запроса, сгруппированные по форме.
+    """
+    __slots__ = ("count", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.shapes: Counter[str] = Counter()
+
+    def record(self, statement: str) -> None:
+        self.count += 1
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self) -> list[tuple[str, int]]:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= repeat_threshold]
+
+
+_current_log: contextvars.ContextVar[QueryLog | None] = contextvars.ContextVar("query_log", default=None)
+# Отчёт последнего запроса: для тестов, где приложение работает в другом потоке
+last_report: dict | None = None
+
+
+def instrument_engine(engine) -> None:
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _record_statement(conn, cursor, statement, parameters, context, executemany):
+        query_log = _current_log.get()
+        if query_log is not None:
+            query_log.record(statement)
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает SQL-запросы каждого HTTP-запроса и сверяет их с бюджетом маршрута
+    (@query_budget). Повторяющиеся запросы одной формы отмечаются как N+1.
+
+    Проверка выполняется перед отправкой заголовков ответа: к этому моменту
+    обработчик уже завершён. В режиме raise ответ с превышением заменяется на 500.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if mode == "off" or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        query_log = QueryLog()
+        token = _current_log.set(query_log)
+        replaced = False
+
+        async def send_checked(message: Message) -> None:
+            nonlocal replaced
+            if replaced:
+                return
+            if message["type"] == "http.response.start":
+                report = _report(scope, query_log)
+                message.setdefault("headers", [])
+                message["headers"].append((b"x-query-count", str(report["count"]).encode()))
+                if report["violations"]:
+                    logger.warning(
+                        "Query budget violation on %s %s: %s",
+                        scope["method"], report["route"], "; ".join(report["violations"]),
+                    )
+                    if mode == "raise":
+                        replaced = True
+                        body = json.dumps({"detail": report["violations"]}).encode()
+                        await send({
+                            "type": "http.response.start",
+                            "status": 500,
+                            "headers": [
+                                (b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode()),
+                            ],
+                        })
+                        await send({"type": "http.response.body", "body": body})
+                        return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_checked)
+        finally:
+            _current_log.reset(token)
+
+
+def _report(scope: Scope, query_log: QueryLog) -> dict:
+    global last_report
+    route = scope.get("route")
+    budget = getattr(getattr(route, "endpoint", None), "__query_budget__", None)
+    repeated = query_log.repeated()
+    violations = []
+    if budget is not None and query_log.count > budget:
+        violations.append(f"{query_log.count} queries, budget is {budget}")
+    for shape, count in repeated:
+        violations.append(f"possible N+1: {count}x {shape[:200]}")
+    last_report = {
+        "method": scope["method"],
+        "route": getattr(route, "path", None) or scope["path"],
+        "count": query_log.count,
+        "budget": budget,
+        "repeated": repeated,
+        "violations": violations,
+    }
+    return last_report
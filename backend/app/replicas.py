@@ -0,0 +1,98 @@
+import time
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import READ_YOUR_WRITES_SECONDS, REPLICA_EJECT_SECONDS
+from app.database import replica_engines
+
+
+# Cookie, который закрепляет клиента за основной БД после его собственной записи
+PRIMARY_PIN_COOKIE = "db_primary_pin"
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class ReplicaSet:
+    """
+    Реплики для чтения: выбор по кругу и временное исключение реплики после
+    ошибки соединения.
+    """
+
+    def __init__(self, engines: list[AsyncEngine], eject_seconds: float):
+        self.engines = engines
+        self.session_makers = [
+            async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            for engine in engines
+        ]
+        self.eject_seconds = eject_seconds
+        self.ejections = 0
+        self._next = 0
+        self._ejected_until = [0.0] * len(engines)
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def choose(self) -> int | None:
+        """
+        Индекс следующей доступной реплики или None, если читать нужно с основной БД.
+        """
+        now = time.monotonic()
+        if not self.engines:
+            return None
+        for _ in range(len(self.engines)):
+            index = self._next
+            self._next = (self._next + 1) % len(self.engines)
+            if self._ejected_until[index] <= now:
+                return index
+        return None
+
+    def eject(self, index: int) -> None:
+        self._ejected_until[index] = time.monotonic() + self.eject_seconds
+        self.ejections += 1
+
+    def is_replica(self, session: AsyncSession) -> bool:
+        """
+        Читает ли сессия с реплики (данные могут отставать от основной БД).
+        """
+        return session.bind in self.engines
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "url": engine.url.render_as_string(hide_password=True),
+                "ejected": self._ejected_until[index] > now,
+                **engine.pool.stats(),
+            }
+            for index, engine in enumerate(self.engines)
+        ]
+
+
+replica_set = ReplicaSet(replica_engines, REPLICA_EJECT_SECONDS)
+
+
+class ReadYourWritesMiddleware:
+    """
+    После успешного изменяющего запроса ставит клиенту короткоживущий cookie,
+    пока он есть, чтения этого клиента идут на основную БД.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.cookie = (
+            f"{PRIMARY_PIN_COOKIE}=1; Max-Age={READ_YOUR_WRITES_SECONDS}; "
+            "Path=/; HttpOnly; SameSite=Lax"
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS or not replica_set:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_pin(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                MutableHeaders(scope=message).append("set-cookie", self.cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
@@ -0,0 +1,17 @@
+from fastapi import Response
+from pydantic import BaseModel
+
+
+class RawJSONResponse(Response):
+    """
+    Ответ с уже сериализованным JSON: тело отдаётся как есть,
+    без повторной валидации и сериализации через response_model.
+    """
+    media_type = "application/json"
+
+
+def model_json_response(model: BaseModel) -> Response:
+    """
+    Сериализует собранную (обычно через model_construct) схему один раз в байты.
+    """
+    return RawJSONResponse(content=model.model_dump_json().encode())
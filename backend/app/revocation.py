@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import func, or_, select
+
+from app.cache import register_invalidator
+from app.config import AUTH_REVOCATION_MAX_AGE, AUTH_REVOCATION_REFRESH_SECONDS
+from app.database import async_session_maker
+from app.models.users import User as UserModel
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationList:
+    """
+    Компактный снимок таблицы users для проверки токенов без запроса в БД.
+
+    Хранит два битовых массива, индексированных id пользователя:
+    деактивированные пользователи и продавцы. Проверка токена — O(1).
+    Пользователи с id больше последнего известного созданы после снимка,
+    поэтому их claims ещё не могли устареть.
+    """
+
+    def __init__(self):
+        self._revoked = bytearray()
+        self._sellers = bytearray()
+        self._max_id = 0
+        # Пользователи, изменённые в этом процессе после последнего снимка:
+        # до следующего обновления их проверяем по БД
+        self._pending: dict[int, float] = {}
+        self.refreshed_at: float | None = None
+
+    @staticmethod
+    def _bit(bitmap: bytearray, user_id: int) -> bool:
+        index = user_id >> 3
+        return index < len(bitmap) and bool(bitmap[index] & (1 << (user_id & 7)))
+
+    @staticmethod
+    def _set_bit(bitmap: bytearray, user_id: int) -> None:
+        bitmap[user_id >> 3] |= 1 << (user_id & 7)
+
+    def is_fresh(self) -> bool:
+        return (
+            self.refreshed_at is not None
+            and time.monotonic() - self.refreshed_at < AUTH_REVOCATION_MAX_AGE
+        )
+
+    def check(self, user_id: int, role: str) -> bool | None:
+        """
+        True — claims токена актуальны, False — токен отозван,
+        None — данных недостаточно и пользователя нужно проверить по БД.
+        """
+        if not self.is_fresh() or user_id in self._pending:
+            return None
+        if user_id > self._max_id:
+            return True
+        if self._bit(self._revoked, user_id):
+            return False
+        is_seller = self._bit(self._sellers, user_id)
+        return is_seller == (role == "seller")
+
+    def mark_changed(self, user_id: int | None) -> None:
+        if user_id is None:
+            self.refreshed_at = None
+        else:
+            self._pending[user_id] = time.monotonic()
+
+    async def refresh(self) -> None:
+        """
+        Перечитывает из БД деактивированных пользователей и продавцов.
+        """
+        started_at = time.monotonic()
+        async with async_session_maker() as session:
+            max_id = await session.scalar(select(func.max(UserModel.id))) or 0
+            rows = (await session.execute(
+                select(UserModel.id, UserModel.is_active, UserModel.role).where(
+                    or_(UserModel.is_active == False, UserModel.role == "seller")
+                )
+            )).all()
+
+        revoked = bytearray((max_id >> 3) + 1)
+        sellers = bytearray((max_id >> 3) + 1)
+        for user_id, is_active, role in rows:
+            if user_id > max_id:
+                continue
+            if not is_active:
+                self._set_bit(revoked, user_id)
+            if role == "seller":
+                self._set_bit(sellers, user_id)
+
+        self._revoked, self._sellers, self._max_id = revoked, sellers, max_id
+        # Изменения, отмеченные во время чтения, могли не попасть в снимок
+        self._pending = {
+            user_id: marked_at
+            for user_id, marked_at in self._pending.items()
+            if marked_at >= started_at
+        }
+        self.refreshed_at = started_at
+
+
+revocation_list = RevocationList()
+register_invalidator("users", revocation_list.mark_changed)
+
+
+async def run_revocation_refresher() -> None:
+    """
+    Фоновая задача: периодически обновляет список отзыва.
+    """
+    while True:
+        try:
+            await revocation_list.refresh()
+        except Exception:
+            logger.exception("Failed to refresh token revocation list")
+        await asyncio.sleep(AUTH_REVOCATION_REFRESH_SECONDS)
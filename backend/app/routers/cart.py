@@ -1,127 +1,270 @@
 from decimal import Decimal
-from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlalchemy import delete, select
+import hashlib
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from app.auth import get_current_user
+from app.auth import TokenPrincipal, get_token_principal
 from app.db_depends import get_async_db
 from app.models.cart_items import CartItem as CartItemModel
-from app.models.products import Product as ProductModel
+from app.models.products import PRODUCT_RESPONSE_COLUMNS, Product as ProductModel
 from app.models.users import User as UserModel
+from app.query_budget import query_budget
+from app.responses import model_json_response
 from app.schemas import (
     Cart as CartSchema,
     CartItem as CartItemSchema,
+    CartSummary,
+    CartItemBatch,
     CartItemCreate,
     CartItemUpdate,
+    ProductResponce,
 )
 
 router = APIRouter(prefix="/api/cart", tags=["cart"])
 
-async def _ensure_product_available(db: AsyncSession, product_id: int) -> None:
-    result = await db.scalars(
-        select(ProductModel).where(
-            ProductModel.id == product_id,
-            ProductModel.is_active == True,
-        )
+def _upsert_quantity(stmt, increment: bool):
+    """
+    Добавляет к INSERT в cart_items ON CONFLICT по (user_id, product_id):
+    increment=True прибавляет количество к существующему, иначе заменяет его.
+    """
+    quantity = CartItemModel.quantity + stmt.excluded.quantity if increment else stmt.excluded.quantity
+    return stmt.on_conflict_do_update(
+        constraint="uq_cart_items_user_product",
+        set_={"quantity": quantity, "updated_at": func.now()},
     )
-    product = result.first()
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found or inactive",
-        )
-        
-async def _get_cart_item(
-    db: AsyncSession, user_id: int, product_id: int
-) -> CartItemModel | None:
-    result = await db.scalars(
-        select(CartItemModel)
-        .options(selectinload(CartItemModel.product))
-        .where(
-            CartItemModel.user_id == user_id,
-            CartItemModel.product_id == product_id,
+
+def _cart_item_from_row(row) -> CartItemSchema:
+    """
+    Собирает позицию корзины из строки (cart_item_id, quantity, *колонки товара).
+    """
+    return CartItemSchema.model_construct(
+        id=row.cart_item_id,
+        quantity=row.quantity,
+        product=ProductResponce.from_row(row),
+    )
+
+async def _load_cart(db: AsyncSession, user_id: int) -> CartSchema:
+    """
+    Собирает корзину одним запросом по нужным колонкам, без ORM-объектов
+    и повторной валидации схем.
+    """
+    rows = (await db.execute(
+        select(
+            CartItemModel.id.label("cart_item_id"),
+            CartItemModel.quantity,
+            *PRODUCT_RESPONSE_COLUMNS,
         )
+        .join(ProductModel, ProductModel.id == CartItemModel.product_id)
+        .where(CartItemModel.user_id == user_id)
+        .order_by(CartItemModel.id)
+    )).all()
+
+    total_quantity = 0
+    total_price_decimal = Decimal("0")
+    cart_items = []
+    for row in rows:
+        total_quantity += row.quantity
+        total_price_decimal += Decimal(row.quantity) * row.price
+        cart_items.append(_cart_item_from_row(row))
+
+    return CartSchema.model_construct(
+        user_id=user_id,
+        items=cart_items,
+        total_quantity=total_quantity,
+        total_price=total_price_decimal,
     )
-    return result.first()
 
 @router.get("/", response_model=CartSchema)
+@query_budget(2)
 async def get_cart(
     db: AsyncSession = Depends(get_async_db),
-    current_user: UserModel = Depends(get_current_user),
+    current_user: TokenPrincipal | UserModel = Depends(get_token_principal),
 ):
-    result = await db.scalars(
-        select(CartItemModel)
-        .options(selectinload(CartItemModel.product))
+    return model_json_response(await _load_cart(db, current_user.id))
+
+@router.get("/summary", response_model=CartSummary)
+async def get_cart_summary(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenPrincipal | UserModel = Depends(get_token_principal),
+):
+    """
+    Возвращает итоги корзины одним агрегирующим запросом, без загрузки товаров.
+
+    revision — отпечаток итогов и времени последнего изменения позиций;
+    он же отдаётся в ETag, и при совпадении If-None-Match ответ будет 304.
+    """
+    row = (await db.execute(
+        select(
+            func.count(CartItemModel.id),
+            func.coalesce(func.sum(CartItemModel.quantity), 0),
+            func.coalesce(func.sum(CartItemModel.quantity * ProductModel.price), 0),
+            func.max(CartItemModel.updated_at),
+        )
+        .join(ProductModel, ProductModel.id == CartItemModel.product_id)
         .where(CartItemModel.user_id == current_user.id)
-        .order_by(CartItemModel.id)
-    )
-    items = result.all()
+    )).one()
+    item_count, total_quantity, total_price, updated_at = row
 
-    total_quantity = sum(item.quantity for item in items)
-    price_items = (
-        Decimal(item.quantity) * 
-        (item.product.price if item.product.price is not None else Decimal("0"))
-        for item in items
-    )
-    total_price_decimal = sum(price_items, Decimal("0"))
-
-    # Явное преобразование ORM-объектов в Pydantic схемы
-    cart_items = [CartItemSchema.model_validate(item) for item in items]
-    
-    return CartSchema(
-        user_id=current_user.id,
-        items=cart_items,  # Используем преобразованный список
+    revision = hashlib.blake2s(
+        f"{item_count}:{total_quantity}:{total_price}:{updated_at}".encode(), digest_size=8
+    ).hexdigest()
+    etag = f'"{revision}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+
+    return CartSummary(
+        item_count=item_count,
         total_quantity=total_quantity,
-        total_price=total_price_decimal
+        total_price=Decimal(total_price),
+        revision=revision,
     )
 
+@router.post("/items:batch", response_model=CartSchema)
+async def batch_update_cart(
+    payload: CartItemBatch,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenPrincipal | UserModel = Depends(get_token_principal),
+):
+    """
+    Применяет набор операций add/set/remove к корзине в одной транзакции
+    и возвращает обновлённую корзину.
+
+    Операции по одному товару сворачиваются в одну итоговую; все товары
+    проверяются одним запросом, изменения — один DELETE и не более
+    одного многострочного upsert на каждый режим (add и set).
+    """
+    final: dict[int, tuple[str, int]] = {}
+    for op in payload.items:
+        previous = final.get(op.product_id)
+        if op.mode == "add" and op.quantity < 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Quantity for product {op.product_id} must be at least 1",
+            )
+        if op.mode == "remove" or (op.mode == "set" and op.quantity == 0):
+            final[op.product_id] = ("remove", 0)
+        elif op.mode == "set":
+            final[op.product_id] = ("set", op.quantity)
+        elif previous is None:
+            final[op.product_id] = ("add", op.quantity)
+        elif previous[0] == "remove":
+            final[op.product_id] = ("set", op.quantity)
+        else:
+            final[op.product_id] = (previous[0], previous[1] + op.quantity)
+
+    upserts = {product_id: op for product_id, op in final.items() if op[0] != "remove"}
+    if upserts:
+        available = set(await db.scalars(
+            select(ProductModel.id).where(
+                ProductModel.id.in_(upserts),
+                ProductModel.is_active == True,
+            )
+        ))
+        missing = sorted(set(upserts) - available)
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Products not found or inactive: {missing}",
+            )
+
+    removed = [product_id for product_id, op in final.items() if op[0] == "remove"]
+    if removed:
+        await db.execute(
+            delete(CartItemModel).where(
+                CartItemModel.user_id == current_user.id,
+                CartItemModel.product_id.in_(removed),
+            )
+        )
+    for mode in ("add", "set"):
+        rows = [
+            {"user_id": current_user.id, "product_id": product_id, "quantity": quantity}
+            for product_id, (op_mode, quantity) in upserts.items()
+            if op_mode == mode
+        ]
+        if rows:
+            await db.execute(
+                _upsert_quantity(pg_insert(CartItemModel).values(rows), increment=mode == "add")
+            )
+
+    await db.commit()
+    return model_json_response(await _load_cart(db, current_user.id))
+
 @router.post("/items", response_model=CartItemSchema, status_code=status.HTTP_201_CREATED)
 async def add_item_to_cart(
     payload: CartItemCreate,
     db: AsyncSession = Depends(get_async_db),
-    current_user: UserModel = Depends(get_current_user),
+    current_user: TokenPrincipal | UserModel = Depends(get_token_principal),
 ):
-    await _ensure_product_available(db, payload.product_id)
-
-    cart_item = await _get_cart_item(db, current_user.id, payload.product_id)
-    if cart_item:
-        cart_item.quantity += payload.quantity
-    else:
-        cart_item = CartItemModel(
-            user_id=current_user.id,
-            product_id=payload.product_id,
-            quantity=payload.quantity,
-        )
-        db.add(cart_item)
+    """
+    Добавляет товар в корзину или увеличивает его количество.
+    Один запрос: INSERT ... ON CONFLICT, вставляющий строку только для
+    активного товара, и выборка нужных колонок товара из его RETURNING.
+    """
+    available = select(
+        literal(current_user.id), ProductModel.id, literal(payload.quantity)
+    ).where(
+        ProductModel.id == payload.product_id,
+        ProductModel.is_active == True,
+    )
+    upserted = _upsert_quantity(
+        pg_insert(CartItemModel).from_select(["user_id", "product_id", "quantity"], available),
+        increment=True,
+    ).returning(CartItemModel.id, CartItemModel.product_id, CartItemModel.quantity).cte("upserted")
 
+    row = (await db.execute(
+        select(upserted.c.id.label("cart_item_id"), upserted.c.quantity, *PRODUCT_RESPONSE_COLUMNS)
+        .join(ProductModel, ProductModel.id == upserted.c.product_id)
+    )).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found or inactive",
+        )
     await db.commit()
-    updated_item = await _get_cart_item(db, current_user.id, payload.product_id)
-    return updated_item
+    return _cart_item_from_row(row)
 
 @router.put("/items/{product_id}", response_model=CartItemSchema)
 async def update_cart_item(
     product_id: int,
     payload: CartItemUpdate,
     db: AsyncSession = Depends(get_async_db),
-    current_user: UserModel = Depends(get_current_user),
+    current_user: TokenPrincipal | UserModel = Depends(get_token_principal),
 ):
-    await _ensure_product_available(db, product_id)
-
-    cart_item = await _get_cart_item(db, current_user.id, product_id)
-    if not cart_item:
-        raise HTTPException(status_code=404, detail="Cart item not found")
-
-    cart_item.quantity = payload.quantity
+    """
+    Устанавливает количество товара в корзине одним UPDATE ... FROM products RETURNING.
+    """
+    row = (await db.execute(
+        update(CartItemModel)
+        .where(
+            CartItemModel.user_id == current_user.id,
+            CartItemModel.product_id == product_id,
+            ProductModel.id == CartItemModel.product_id,
+            ProductModel.is_active == True,
+        )
+        .values(quantity=payload.quantity, updated_at=func.now())
+        .returning(
+            CartItemModel.id.label("cart_item_id"),
+            CartItemModel.quantity,
+            *PRODUCT_RESPONSE_COLUMNS,
+        ),
+        execution_options={"synchronize_session": False},
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Cart item not found or product inactive")
     await db.commit()
-    updated_item = await _get_cart_item(db, current_user.id, product_id)
-    return updated_item
+    return _cart_item_from_row(row)
 
 @router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_item_from_cart(
     item_id: int,
     db: AsyncSession = Depends(get_async_db),
-    current_user: UserModel = Depends(get_current_user),
+    current_user: TokenPrincipal | UserModel = Depends(get_token_principal),
 ):
     result = await db.scalars(
         select(CartItemModel)
@@ -141,7 +284,7 @@ async def remove_item_from_cart(
 @router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
 async def clear_cart(
     db: AsyncSession = Depends(get_async_db),
-    current_user: UserModel = Depends(get_current_user),
+    current_user: TokenPrincipal | UserModel = Depends(get_token_principal),
 ):
     await db.execute(delete(CartItemModel).where(CartItemModel.user_id == current_user.id))
     await db.commit()
@@ -1,28 +1,131 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select, update
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from pydantic import TypeAdapter
+from sqlalchemy import delete, insert, literal, select, union_all, update
+from sqlalchemy.orm import Session, aliased
 
 from app.models.categories import Category 
-from app.schemas import CategoryCreate, CategoryResponce
+from app.models.category_closure import CategoryClosure
+from app.schemas import CategoryCreate, CategoryResponce, CategoryTreeNode
+from app.cache import invalidate
+from app.change_feed import publish_change
+from app.catalog_cache import catalog_response, catalog_results
+from app.query_budget import query_budget
 
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db_depends import get_async_db
+from app.db_depends import get_async_db, get_async_read_db
+from app.replicas import replica_set
 
 router = APIRouter(prefix="/api/categories",
                    tags=["categories"],
                    )
 
+_category_list_adapter = TypeAdapter(list[CategoryResponce])
+_category_tree_adapter = TypeAdapter(list[CategoryTreeNode])
+
 @router.get('/', response_model=list[CategoryResponce], status_code=status.HTTP_200_OK)
-async def get_all_categories(db: AsyncSession = Depends(get_async_db)):
+@query_budget(1)
+async def get_all_categories(request: Request, db: AsyncSession = Depends(get_async_read_db)):
     """
     Get all active categories
     """
+    cached, token = await catalog_results.get("categories")
+    if cached is not None:
+        return catalog_response(request, cached)
+
     stmt = select(Category).where(Category.is_active == True)
     result = await db.scalars(stmt)
     categories = result.all()
-    return categories
+
+    payload = _category_list_adapter.dump_json(
+        [CategoryResponce.model_validate(category) for category in categories]
+    )
+    await catalog_results.set("categories", payload, token, from_replica=replica_set.is_replica(db))
+    return catalog_response(request, payload)
+
+@router.get('/tree', response_model=list[CategoryTreeNode], status_code=status.HTTP_200_OK)
+@query_budget(1)
+async def get_category_tree(request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Возвращает дерево активных категорий одним запросом.
+    Ветки под неактивной категорией в дерево не попадают.
+    """
+    cached, token = await catalog_results.get("categories:tree")
+    if cached is not None:
+        return catalog_response(request, cached)
+
+    result = await db.execute(
+        select(Category.id, Category.name, Category.parent_id)
+        .where(Category.is_active == True)
+        .order_by(Category.id)
+    )
+    nodes = {
+        row.id: {"id": row.id, "name": row.name, "parent_id": row.parent_id, "children": []}
+        for row in result
+    }
+    roots = []
+    for node in nodes.values():
+        if node["parent_id"] is None:
+            roots.append(node)
+        elif node["parent_id"] in nodes:
+            nodes[node["parent_id"]]["children"].append(node)
+
+    payload = _category_tree_adapter.dump_json(_category_tree_adapter.validate_python(roots))
+    await catalog_results.set("categories:tree", payload, token, from_replica=replica_set.is_replica(db))
+    return catalog_response(request, payload)
+
+async def _insert_closure_rows(db: AsyncSession, category_id: int, parent_id: int | None) -> None:
+    """
+    Добавляет новую категорию в таблицу замыкания: строку на саму себя
+    и по строке на каждого предка родителя.
+    """
+    rows = select(literal(category_id), literal(category_id), literal(0))
+    if parent_id is not None:
+        rows = union_all(
+            rows,
+            select(
+                CategoryClosure.ancestor_id,
+                literal(category_id),
+                CategoryClosure.depth + 1,
+            ).where(CategoryClosure.descendant_id == parent_id),
+        )
+    await db.execute(
+        insert(CategoryClosure).from_select(["ancestor_id", "descendant_id", "depth"], rows)
+    )
+
+async def _move_closure_subtree(db: AsyncSession, category_id: int, parent_id: int | None) -> None:
+    """
+    Переносит поддерево категории под нового родителя:
+    удаляет связи поддерева со старыми предками и строит связи с новыми.
+    """
+    subtree = select(CategoryClosure.descendant_id).where(
+        CategoryClosure.ancestor_id == category_id
+    )
+    await db.execute(
+        delete(CategoryClosure).where(
+            CategoryClosure.descendant_id.in_(subtree),
+            CategoryClosure.ancestor_id.not_in(subtree),
+        )
+    )
+    if parent_id is None:
+        return
+
+    ancestors = aliased(CategoryClosure)
+    descendants = aliased(CategoryClosure)
+    await db.execute(
+        insert(CategoryClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                ancestors.ancestor_id,
+                descendants.descendant_id,
+                ancestors.depth + descendants.depth + 1,
+            ).where(
+                ancestors.descendant_id == parent_id,
+                descendants.ancestor_id == category_id,
+            ),
+        )
+    )
 
 @router.post("/", response_model=CategoryResponce, status_code=status.HTTP_201_CREATED)
 async def create_category(category: CategoryCreate, db: AsyncSession = Depends(get_async_db)):
@@ -51,8 +154,12 @@ async def create_category(category: CategoryCreate, db: AsyncSession = Depends(g
     )
     
     db.add(db_category)
+    await db.flush()  # Получаем сгенерированный id для таблицы замыкания
+    await _insert_closure_rows(db, db_category.id, category.parent_id)
+    await publish_change(db, "categories", db_category.id)
     await db.commit()
     await db.refresh(db_category)  # Обязательно для получения сгенерированного id
+    invalidate("categories", db_category.id)
     return db_category
 
 @router.put("/{category_id}", response_model=CategoryCreate, status_code=status.HTTP_200_OK)
@@ -75,15 +182,31 @@ async def update_category(category_id: int, category: CategoryCreate, db: AsyncS
         parent = result.first()
         if parent is None:
             raise HTTPException(status_code=400, detail="Parent category not found")
+
+        # Нельзя сделать родителем саму категорию или её потомка
+        in_subtree = await db.scalar(
+            select(CategoryClosure.descendant_id).where(
+                CategoryClosure.ancestor_id == category_id,
+                CategoryClosure.descendant_id == category.parent_id,
+            )
+        )
+        if in_subtree is not None:
+            raise HTTPException(status_code=400,
+                                detail="Category cannot be moved under itself or its descendant")
         
     #Обновляем 
     update_data = category.model_dump(exclude_unset=True)
+    parent_changed = "parent_id" in update_data and update_data["parent_id"] != db_category.parent_id
     await db.execute(
     update(Category)
     .where(Category.id == category_id)
     .values(**update_data)
     )
+    if parent_changed:
+        await _move_closure_subtree(db, category_id, update_data["parent_id"])
+    await publish_change(db, "categories", category_id)
     await db.commit()
+    invalidate("categories", category_id)
     return db_category
 
 @router.delete("/{category_id}", status_code=status.HTTP_200_OK)
@@ -99,8 +222,12 @@ async def delete_category(category_id: int, db: AsyncSession = Depends(get_async
     if db_category is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
 
+    # Мягкое удаление: строки замыкания остаются, а выборки по поддереву
+    # отсекают неактивные категории и всё, что под ними
     await db.execute(update(Category).where(Category.id == category_id).values(is_active=False))
+    await publish_change(db, "categories", category_id)
     await db.commit()
+    invalidate("categories", category_id)
 
     return {"status": "success", "message": "Category marked as inactive"}
 
@@ -0,0 +1,57 @@
+import hmac
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse
+
+from app.config import INTERNAL_API_TOKEN
+from app.database import pool_stats
+from app.metrics import render_metrics
+from app.replicas import replica_set
+
+
+def require_internal_access(request: Request) -> None:
+    """
+    Пускает к служебным эндпоинтам по токену INTERNAL_API_TOKEN,
+    а если он не задан — только запросы с localhost.
+    """
+    if INTERNAL_API_TOKEN:
+        token = request.headers.get("x-internal-token", "")
+        if hmac.compare_digest(token, INTERNAL_API_TOKEN):
+            return
+    elif request.client is not None and request.client.host in ("127.0.0.1", "::1"):
+        return
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Internal endpoint")
+
+
+router = APIRouter(
+    prefix="/api/internal",
+    tags=["internal"],
+    dependencies=[Depends(require_internal_access)],
+)
+# /metrics — по стандартному для Prometheus пути, без префикса /api
+metrics_router = APIRouter(tags=["internal"], dependencies=[Depends(require_internal_access)])
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Метрики всех воркеров в текстовом формате Prometheus.
+    """
+    return PlainTextResponse(
+        await render_metrics(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@router.get("/pool")
+async def get_pool_stats():
+    """
+    Состояние пулов соединений с БД в этом воркере (основная БД и реплики):
+    размер, занятые соединения, overflow, число и длительность ожиданий
+    свободного соединения, таймауты.
+    """
+    return {
+        "primary": pool_stats(),
+        "replicas": replica_set.stats(),
+        "replica_ejections": replica_set.ejections,
+    }
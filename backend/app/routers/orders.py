@@ -1,16 +1,23 @@
 from decimal import Decimal
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import delete, func, select
+from sqlalchemy import Integer, column, delete, func, insert, select, update, values
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from app.auth import get_current_user
+from app.auth import TokenPrincipal, get_token_principal
 from app.db_depends import get_async_db
 from app.models.cart_items import CartItem as CartItemModel
 from app.models.orders import Order as OrderModel, OrderItem as OrderItemModel
+from app.models.products import PRODUCT_RESPONSE_COLUMNS, Product as ProductModel
 from app.models.users import User as UserModel
-from app.schemas import Order as OrderSchema, OrderList
+from app.schemas import Order as OrderSchema, OrderItem as OrderItemSchema, OrderList, ProductResponce
+from app.cache import invalidate
+from app.change_feed import publish_change
+from app.export import export_response
+from app.query_budget import query_budget
+from app.responses import model_json_response
+from app import metrics
 
 router = APIRouter(
     prefix="/api/orders",
@@ -32,101 +39,256 @@ async def _load_order_with_items(db: AsyncSession, order_id: int) -> OrderModel
 @router.post("/checkout", response_model=OrderSchema, status_code=status.HTTP_201_CREATED)
 async def checkout_order(
     db: AsyncSession = Depends(get_async_db),
-    current_user: UserModel = Depends(get_current_user),
+    current_user: TokenPrincipal | UserModel = Depends(get_token_principal),
 ):
     """
     Создаёт заказ на основе текущей корзины пользователя.
     Сохраняет позиции заказа, вычитает остатки и очищает корзину.
+
+    Число запросов к БД не зависит от размера корзины: остатки списываются
+    одним условным UPDATE, позиции заказа вставляются одним пакетом,
+    а ответ собирается из уже полученных данных.
     """
-    cart_result = await db.scalars(
-        select(CartItemModel)
-        .options(selectinload(CartItemModel.product))
+    # Читаем корзину и блокируем строки товаров в порядке id,
+    # чтобы параллельные оформления не блокировали друг друга взаимно
+    cart_rows = (await db.execute(
+        select(
+            CartItemModel.product_id,
+            CartItemModel.quantity,
+            ProductModel.name,
+            ProductModel.price,
+            ProductModel.stock,
+            ProductModel.is_active,
+        )
+        .join(ProductModel, ProductModel.id == CartItemModel.product_id)
         .where(CartItemModel.user_id == current_user.id)
-        .order_by(CartItemModel.id)
-    )
-    cart_items = cart_result.all()
-    if not cart_items:
+        .order_by(ProductModel.id)
+        .with_for_update(of=ProductModel)
+    )).all()
+    if not cart_rows:
+        metrics.inc("checkout_total", (("outcome", "empty_cart"),))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cart is empty")
 
-    order = OrderModel(user_id=current_user.id)
-    total_amount = Decimal("0")
-
-    for cart_item in cart_items:
-        product = cart_item.product
-        if not product or not product.is_active:
+    for row in cart_rows:
+        if not row.is_active:
+            metrics.inc("checkout_total", (("outcome", "product_unavailable"),))
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Product {cart_item.product_id} is unavailable",
+                detail=f"Product {row.product_id} is unavailable",
             )
-        if product.stock < cart_item.quantity:
+        if row.stock < row.quantity:
+            metrics.inc("checkout_total", (("outcome", "out_of_stock"),))
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Not enough stock for product {product.name}",
+                detail=f"Not enough stock for product {row.name}",
             )
-
-        unit_price = product.price
-        if unit_price is None:
+        if row.price is None:
+            metrics.inc("checkout_total", (("outcome", "no_price"),))
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Product {product.name} has no price set",
+                detail=f"Product {row.name} has no price set",
             )
-        total_price = unit_price * cart_item.quantity
-        total_amount += total_price
-
-        order_item = OrderItemModel(
-            product_id=cart_item.product_id,
-            quantity=cart_item.quantity,
-            unit_price=unit_price,
-            total_price=total_price,
-        )
-        order.items.append(order_item)
 
-        product.stock -= cart_item.quantity
+    # Списываем остатки одним запросом; условие stock >= quantity не даёт уйти в минус
+    cart = values(
+        column("product_id", Integer), column("quantity", Integer), name="cart"
+    ).data([(row.product_id, row.quantity) for row in cart_rows])
+    updated = (await db.execute(
+        update(ProductModel)
+        .where(
+            ProductModel.id == cart.c.product_id,
+            ProductModel.is_active == True,
+            ProductModel.stock >= cart.c.quantity,
+        )
+        .values(stock=ProductModel.stock - cart.c.quantity)
+        .returning(*PRODUCT_RESPONSE_COLUMNS),
+        execution_options={"synchronize_session": False},
+    )).all()
+    if len(updated) != len(cart_rows):
+        await db.rollback()
+        metrics.inc("checkout_total", (("outcome", "stock_conflict"),))
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Stock changed during checkout, please try again",
+        )
+    products = {product.id: product for product in updated}
 
-    order.total_amount = total_amount
+    total_amount = sum(
+        (row.price * row.quantity for row in cart_rows), Decimal("0")
+    )
+    order = OrderModel(user_id=current_user.id, total_amount=total_amount)
     db.add(order)
+    await db.flush()
+
+    item_values = [
+        {
+            "order_id": order.id,
+            "product_id": row.product_id,
+            "quantity": row.quantity,
+            "unit_price": row.price,
+            "total_price": row.price * row.quantity,
+        }
+        for row in cart_rows
+    ]
+    item_ids = (await db.scalars(
+        insert(OrderItemModel).returning(OrderItemModel.id, sort_by_parameter_order=True),
+        item_values,
+    )).all()
 
     await db.execute(delete(CartItemModel).where(CartItemModel.user_id == current_user.id))
+
+    # Остатки входят в кэшированные ответы каталога: сбрасываются только ответы
+    # с купленными товарами. Распроданный товар меняет выборки in_stock и счётчики,
+    # поэтому тогда сбрасывается весь кэш товаров.
+    sold_out = [product.id for product in updated if product.stock == 0]
+    sold_out_id = sold_out[0] if len(sold_out) == 1 else None
+    if sold_out:
+        await publish_change(db, "products", sold_out_id)
+    else:
+        await publish_change(db, "stock", [product.id for product in updated])
     await db.commit()
+    if sold_out:
+        invalidate("products", sold_out_id)
+    else:
+        for product in updated:
+            invalidate("stock", product.id)
+    metrics.inc("checkout_total", (("outcome", "success"),))
 
-    created_order = await _load_order_with_items(db, order.id)
-    if not created_order:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to load created order",
-        )
-    return created_order
+    return OrderSchema(
+        id=order.id,
+        user_id=order.user_id,
+        status=order.status,
+        total_amount=total_amount,
+        created_at=order.created_at,
+        updated_at=order.updated_at,
+        items=[
+            OrderItemSchema(
+                id=item_id,
+                product_id=item["product_id"],
+                quantity=item["quantity"],
+                unit_price=item["unit_price"],
+                total_price=item["total_price"],
+                product=ProductResponce.model_validate(products[item["product_id"]]),
+            )
+            for item_id, item in zip(item_ids, item_values)
+        ],
+    )
 
 @router.get("/", response_model=OrderList)
+@query_budget(4)
 async def list_orders(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
     db: AsyncSession = Depends(get_async_db),
-    current_user: UserModel = Depends(get_current_user),
+    current_user: TokenPrincipal | UserModel = Depends(get_token_principal),
 ):
     """
     Возвращает заказы текущего пользователя с простой пагинацией.
+
+    Заказы и их позиции с товарами читаются двумя запросами по нужным колонкам
+    и собираются в ответ за один проход, без ORM-объектов и повторной валидации.
     """
     total = await db.scalar(
         select(func.count(OrderModel.id)).where(OrderModel.user_id == current_user.id)
     )
-    result = await db.scalars(
-        select(OrderModel)
-        .options(selectinload(OrderModel.items).selectinload(OrderItemModel.product))
+    order_rows = (await db.execute(
+        select(
+            OrderModel.id,
+            OrderModel.user_id,
+            OrderModel.status,
+            OrderModel.total_amount,
+            OrderModel.created_at,
+            OrderModel.updated_at,
+        )
         .where(OrderModel.user_id == current_user.id)
         .order_by(OrderModel.created_at.desc())
         .offset((page - 1) * page_size)
         .limit(page_size)
+    )).all()
+
+    orders = {
+        row.id: OrderSchema.model_construct(
+            id=row.id,
+            user_id=row.user_id,
+            status=row.status,
+            total_amount=row.total_amount,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
+            items=[],
+        )
+        for row in order_rows
+    }
+    if orders:
+        item_rows = (await db.execute(
+            select(
+                OrderItemModel.id.label("order_item_id"),
+                OrderItemModel.order_id,
+                OrderItemModel.product_id,
+                OrderItemModel.quantity,
+                OrderItemModel.unit_price,
+                OrderItemModel.total_price.label("item_total_price"),
+                *PRODUCT_RESPONSE_COLUMNS,
+            )
+            .join(ProductModel, ProductModel.id == OrderItemModel.product_id)
+            .where(OrderItemModel.order_id.in_(list(orders)))
+            .order_by(OrderItemModel.order_id, OrderItemModel.id)
+        )).all()
+        for row in item_rows:
+            orders[row.order_id].items.append(
+                OrderItemSchema.model_construct(
+                    id=row.order_item_id,
+                    product_id=row.product_id,
+                    quantity=row.quantity,
+                    unit_price=row.unit_price,
+                    total_price=row.item_total_price,
+                    product=ProductResponce.from_row(row),
+                )
+            )
+
+    return model_json_response(
+        OrderList.model_construct(
+            items=list(orders.values()),
+            total=total or 0,
+            page=page,
+            page_size=page_size,
+        )
     )
-    orders = result.all()
 
-    return OrderList(items=orders, total=total or 0, page=page, page_size=page_size)
+@router.get("/export")
+async def export_orders(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Формат выгрузки: ndjson или csv"),
+    current_user: TokenPrincipal | UserModel = Depends(get_token_principal),
+):
+    """
+    Потоковая выгрузка истории заказов текущего пользователя:
+    одна строка на позицию заказа. Строки читаются порциями по (заказ, позиция),
+    каждая — в отдельной короткой транзакции.
+    """
+    stmt = (
+        select(
+            OrderModel.id.label("order_id"),
+            OrderModel.status,
+            OrderModel.total_amount,
+            OrderModel.created_at,
+            OrderModel.updated_at,
+            OrderItemModel.id.label("order_item_id"),
+            OrderItemModel.product_id,
+            OrderItemModel.quantity,
+            OrderItemModel.unit_price,
+            OrderItemModel.total_price,
+        )
+        .join(OrderItemModel, OrderItemModel.order_id == OrderModel.id)
+        .where(OrderModel.user_id == current_user.id)
+    )
+    keyset = {"order_id": OrderModel.id, "order_item_id": OrderItemModel.id}
+    return export_response(stmt, keyset, format, "orders")
 
 @router.get("/{order_id}", response_model=OrderSchema)
+@query_budget(4)
 async def get_order(
     order_id: int,
     db: AsyncSession = Depends(get_async_db),
-    current_user: UserModel = Depends(get_current_user),
+    current_user: TokenPrincipal | UserModel = Depends(get_token_principal),
 ):
     """
     Возвращает детальную информацию по заказу, если он принадлежит пользователю.
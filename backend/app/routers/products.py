@@ -1,17 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File, Form, status
-from sqlalchemy import select, update, func, desc, update
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Query, UploadFile, File, Form, status, Request, Response
+from sqlalchemy import select, update, func, desc, update, text, exists, or_, and_, tuple_
+from sqlalchemy.orm import Session, aliased
+from pydantic import TypeAdapter
 from pathlib import Path
-import uuid
-from app.models.products import Product 
-from app.schemas import ProductResponce, ProductCreate, ProductList
+import asyncio
+import os
+import tempfile
+import json
+from app.models.products import PRODUCT_RESPONSE_COLUMNS, Product 
+from app.schemas import ProductResponce, ProductCreate, ProductList, ProductFacets, CategoryFacet, PriceFacet, StockFacet, ProductImportReport
 from app.models.categories import Category 
+from app.models.category_closure import CategoryClosure
 from app.auth import get_current_seller
 from app.models.users import User
+from app.models.product_import_jobs import ProductImportJob
 from sqlalchemy.ext.asyncio import AsyncSession
 from decimal import Decimal
 from typing import Optional
-from app.db_depends import get_async_db
+from app.db_depends import get_async_db, get_async_read_db
+from app.replicas import replica_set
+from app.cache import TTLCache, invalidate, register_invalidator
+from app.change_feed import publish_change
+from app.export import export_response
+from app.images import remove_product_image, save_product_image
+from app.product_import import ImportTooLarge, run_import, spool_upload
+from app.catalog_cache import catalog_response, catalog_results
+from app.query_budget import query_budget
+from app.config import (
+    PRODUCT_COUNT_CACHE_SIZE,
+    PRODUCT_COUNT_CACHE_TTL,
+    PRODUCT_IMPORT_INLINE_MAX_BYTES,
+    PRODUCT_IMPORT_MAX_BYTES,
+    PRODUCT_PRICE_FACET_BOUNDS,
+)
+from app.pagination import (
+    decode_cursor,
+    encode_cursor,
+    product_cursor_filter,
+    product_cursor_key,
+    product_order_by,
+)
 
 
 router = APIRouter(prefix="/api/products",
@@ -19,56 +47,139 @@ router = APIRouter(prefix="/api/products",
                    )
 
 
-BASE_DIR = Path(__file__).resolve().parent.parent.parent
-MEDIA_ROOT = BASE_DIR / "media" / "products"
-MEDIA_ROOT.mkdir(parents=True, exist_ok=True)
-ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp"}
-MAX_IMAGE_SIZE = 2 * 1024 * 1024  # 2 097 152 байт
+_product_list_adapter = TypeAdapter(list[ProductResponce])
 
-@router.get("/", response_model=ProductList)
-async def get_all_products(
-    page: int = Query(1, ge=1, description="Номер страницы для пагинации"),
-    page_size: int = Query(20, ge=1, le=100, description="Количество товаров на странице"),
-    category_id: Optional[int] = Query(
-        None, description="ID категории для фильтрации"
-    ),
-    min_price: Optional[float] = Query(
-        None, ge=0, description="Минимальная цена товара"
-    ),
-    max_price: Optional[float] = Query(
-        None, ge=0, description="Максимальная цена товара"
-    ),
-    in_stock: Optional[bool] = Query(
-        None, description="true — только товары в наличии, false — только без остатка"
-    ),
-    seller_id: Optional[int] = Query(
-        None, description="ID продавца для фильтрации"
-    ),
-    db: AsyncSession = Depends(get_async_db),
-):
+# Кэш total для списков товаров: ключ — режим подсчёта и нормализованный набор фильтров.
+# Любая запись в products сбрасывает его целиком.
+_count_cache = TTLCache(maxsize=PRODUCT_COUNT_CACHE_SIZE, ttl=PRODUCT_COUNT_CACHE_TTL)
+register_invalidator("products", lambda product_id: _count_cache.clear())
+# Фильтр include_descendants зависит от дерева категорий
+register_invalidator("categories", lambda category_id: _count_cache.clear())
+
+
+def _category_subtree(category_id: int):
     """
-    Возвращает список всех активных товаров с поддержкой фильтров и пагинации.
-    
-    Фильтры применяются последовательно:
-    - category_id: фильтрация по категории
-    - min_price/max_price: фильтрация по ценовому диапазону
-    - in_stock: фильтрация по наличию товара
-    - seller_id: фильтрация по продавцу
-    
-    Пагинация:
-    - page: номер страницы (начиная с 1)
-    - page_size: количество элементов на странице (максимум 100)
+    Подзапрос ID активных категорий поддерева (включая саму категорию)
+    по таблице замыкания. Потомки неактивной категории в выборку не попадают.
     """
-    # Проверка логики min_price <= max_price
-    if min_price is not None and max_price is not None and min_price > max_price:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="min_price не может быть больше max_price",
+    path = aliased(CategoryClosure)
+    inactive_on_path = (
+        select(path.ancestor_id)
+        .join(Category, Category.id == path.ancestor_id)
+        .where(
+            path.descendant_id == CategoryClosure.descendant_id,
+            path.depth <= CategoryClosure.depth,
+            Category.is_active == False,
         )
-    
+    )
+    return select(CategoryClosure.descendant_id).where(
+        CategoryClosure.ancestor_id == category_id,
+        ~exists(inactive_on_path),
+    )
+
+
+async def _count_products(db: AsyncSession, filters: list, mode: str, cache_key: tuple) -> int:
+    """
+    Считает товары по фильтрам: точно через COUNT(*) или по оценке планировщика.
+    Результат кэшируется до следующего изменения товаров.
+    """
+    key = (mode, *cache_key)
+    total = _count_cache.get(key)
+    if total is not None:
+        return total
+
+    if mode == "estimate":
+        # Значения фильтров — только числа и булевы, поэтому их безопасно встроить в SQL
+        stmt = select(Product.id).where(*filters)
+        sql = stmt.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})
+        plan = await db.scalar(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        total = int(plan[0]["Plan"]["Plan Rows"])
+    else:
+        total_stmt = select(func.count()).select_from(Product).where(*filters)
+        total = await db.scalar(total_stmt) or 0
+
+    _count_cache.set(key, total)
+    return total
+
+
+def _price_ranges() -> list[tuple[Decimal, Decimal | None]]:
+    """
+    Ценовые корзины фасета price: [0, b1), [b1, b2), ..., [bn, +inf).
+    """
+    bounds = [Decimal(0), *(Decimal(bound) for bound in PRODUCT_PRICE_FACET_BOUNDS)]
+    return [(low, high) for low, high in zip(bounds, [*bounds[1:], None])]
+
+
+async def _product_facets(db: AsyncSession, filters: list, facets: set[str]) -> ProductFacets:
+    """
+    Считает все запрошенные фасеты одним агрегатным запросом:
+    категории — через GROUPING SETS, цена и наличие — через count(*) FILTER (...).
+    """
+    price_ranges = _price_ranges()
+    columns = [func.count().label("total")]
+    if "in_stock" in facets:
+        columns.append(func.count().filter(Product.stock > 0).label("in_stock"))
+    if "price" in facets:
+        for index, (low, high) in enumerate(price_ranges):
+            condition = Product.price >= low
+            if high is not None:
+                condition = and_(condition, Product.price < high)
+            columns.append(func.count().filter(condition).label(f"price_{index}"))
+
+    if "category" in facets:
+        # Строки по каждой категории плюс итоговая строка (grouping = 1) с остальными фасетами
+        stmt = (
+            select(Product.category_id, func.grouping(Product.category_id).label("is_total"), *columns)
+            .where(*filters)
+            .group_by(func.grouping_sets(tuple_(Product.category_id), tuple_()))
+        )
+    else:
+        stmt = select(*columns).where(*filters)
+    rows = (await db.execute(stmt)).all()
+
+    if "category" in facets:
+        totals = next(row for row in rows if row.is_total == 1)
+        category_rows = sorted(
+            (row for row in rows if row.is_total == 0),
+            key=lambda row: (-row.total, row.category_id),
+        )
+    else:
+        totals = rows[0]
+
+    result = ProductFacets()
+    if "category" in facets:
+        result.category = [
+            CategoryFacet(category_id=row.category_id, count=row.total) for row in category_rows
+        ]
+    if "price" in facets:
+        result.price = [
+            PriceFacet(min_price=low, max_price=high, count=getattr(totals, f"price_{index}"))
+            for index, (low, high) in enumerate(price_ranges)
+        ]
+    if "in_stock" in facets:
+        result.in_stock = StockFacet(
+            in_stock=totals.in_stock,
+            out_of_stock=totals.total - totals.in_stock,
+        )
+    return result
+
+async def _build_product_filters(
+    db: AsyncSession,
+    category_id: Optional[int],
+    include_descendants: bool,
+    min_price: Optional[float],
+    max_price: Optional[float],
+    in_stock: Optional[bool],
+    seller_id: Optional[int],
+) -> list:
+    """
+    Проверяет категорию и продавца из фильтров и собирает условия WHERE
+    для выборки активных товаров.
+    """
     # Валидация существования категории
     if category_id is not None:
-        from app.models.categories import Category
         category_exists = await db.scalar(
             select(func.count()).where(Category.id == category_id, Category.is_active == True)
         )
@@ -80,7 +191,6 @@ async def get_all_products(
     
     # Валидация существования продавца
     if seller_id is not None:
-        from app.models.users import User
         seller_exists = await db.scalar(
             select(func.count()).where(User.id == seller_id, User.is_active == True, User.role == "seller")
         )
@@ -93,7 +203,9 @@ async def get_all_products(
     # Формируем список фильтров
     filters = [Product.is_active == True]
 
-    if category_id is not None:
+    if category_id is not None and include_descendants:
+        filters.append(Product.category_id.in_(_category_subtree(category_id)))
+    elif category_id is not None:
         filters.append(Product.category_id == category_id)
     if min_price is not None:
         filters.append(Product.price >= Decimal(str(min_price)))
@@ -106,41 +218,261 @@ async def get_all_products(
     if seller_id is not None:
         filters.append(Product.seller_id == seller_id)
 
-    # Подсчёт общего количества с учётом фильтров
-    total_stmt = select(func.count()).select_from(Product).where(*filters)
-    total = await db.scalar(total_stmt) or 0
+    return filters
+
 
-    # Проверка валидности номера страницы
-    max_page = (total + page_size - 1) // page_size
-    if page > max_page and total > 0:
+def _check_price_range(min_price: Optional[float], max_price: Optional[float]) -> None:
+    # Проверка логики min_price <= max_price
+    if min_price is not None and max_price is not None and min_price > max_price:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Страница {page} не существует. Максимальный номер страницы: {max_page}",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_price не может быть больше max_price",
         )
 
-    # Выборка товаров с фильтрами и пагинацией
+
+@router.get("/", response_model=ProductList)
+@query_budget(5)
+async def get_all_products(
+    request: Request,
+    page: int = Query(1, ge=1, description="Номер страницы для пагинации"),
+    page_size: int = Query(20, ge=1, le=100, description="Количество товаров на странице"),
+    category_id: Optional[int] = Query(
+        None, description="ID категории для фильтрации"
+    ),
+    include_descendants: bool = Query(
+        False, description="true — учитывать также товары всех подкатегорий category_id"
+    ),
+    min_price: Optional[float] = Query(
+        None, ge=0, description="Минимальная цена товара"
+    ),
+    max_price: Optional[float] = Query(
+        None, ge=0, description="Максимальная цена товара"
+    ),
+    in_stock: Optional[bool] = Query(
+        None, description="true — только товары в наличии, false — только без остатка"
+    ),
+    seller_id: Optional[int] = Query(
+        None, description="ID продавца для фильтрации"
+    ),
+    sort: str = Query(
+        "id", pattern="^(id|price_asc|price_desc|newest)$",
+        description="Сортировка: id, price_asc, price_desc или newest"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы (next_cursor из предыдущего ответа)"
+    ),
+    count: str = Query(
+        "exact", pattern="^(exact|estimate|none)$",
+        description="Подсчёт total: exact — точно, estimate — оценка планировщика, none — не считать"
+    ),
+    facets: Optional[str] = Query(
+        None, pattern="^(category|price|in_stock)(,(category|price|in_stock))*$",
+        description="Фасетные счётчики через запятую: category, price, in_stock"
+    ),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """
+    Возвращает список всех активных товаров с поддержкой фильтров и пагинации.
+    
+    Фильтры применяются последовательно:
+    - category_id: фильтрация по категории (с include_descendants — по всему поддереву)
+    - min_price/max_price: фильтрация по ценовому диапазону
+    - in_stock: фильтрация по наличию товара
+    - seller_id: фильтрация по продавцу
+    
+    Пагинация:
+    - page: номер страницы (начиная с 1)
+    - page_size: количество элементов на странице (максимум 100)
+    - cursor: keyset-пагинация — если передан, page игнорируется и выборка
+      продолжается сразу после последнего товара предыдущей страницы.
+      Курсор для следующей страницы возвращается в next_cursor.
+
+    Подсчёт total (count):
+    - exact: точное количество (кэшируется до изменения товаров)
+    - estimate: оценка планировщика PostgreSQL, total_exact=false
+    - none: total не считается и равен null
+
+    Фасеты (facets): счётчики по категориям, ценовым корзинам и наличию
+    для текущего набора фильтров, считаются одним запросом.
+    """
+    _check_price_range(min_price, max_price)
+    facet_names = set(facets.split(",")) if facets else set()
+
+    # Первые страницы списков отдаются из общего кэша ответов каталога
+    cache_key = None
+    if cursor is None and page == 1:
+        cache_key = (
+            f"products:{page_size}:{category_id}:{include_descendants}:{min_price}:"
+            f"{max_price}:{in_stock}:{seller_id}:{sort}:{count}:{','.join(sorted(facet_names))}"
+        )
+        cached, token = await catalog_results.get(cache_key)
+        if cached is not None:
+            return catalog_response(request, cached)
+    
+    filters = await _build_product_filters(
+        db, category_id, include_descendants, min_price, max_price, in_stock, seller_id
+    )
+
+    # Подсчёт общего количества с учётом фильтров
+    total = None
+    if count != "none":
+        count_key = (
+            category_id,
+            include_descendants,
+            Decimal(str(min_price)) if min_price is not None else None,
+            Decimal(str(max_price)) if max_price is not None else None,
+            in_stock,
+            seller_id,
+        )
+        total = await _count_products(db, filters, count, count_key)
+
+    # Выборка товаров с фильтрами и пагинацией.
+    # Берём на одну строку больше, чтобы понять, есть ли следующая страница.
     products_stmt = (
-        select(Product)
+        select(*PRODUCT_RESPONSE_COLUMNS)
         .where(*filters)
-        .order_by(Product.id)
-        .offset((page - 1) * page_size)
-        .limit(page_size)
+        .order_by(*product_order_by(sort))
+        .limit(page_size + 1)
     )
-    items = (await db.scalars(products_stmt)).all()
+    if cursor is not None:
+        products_stmt = products_stmt.where(
+            product_cursor_filter(sort, decode_cursor(cursor, sort))
+        )
+    else:
+        # Проверка валидности номера страницы (только при точном total)
+        max_page = (total + page_size - 1) // page_size if count == "exact" else 0
+        if page > max_page and max_page > 0:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Страница {page} не существует. Максимальный номер страницы: {max_page}",
+            )
+        products_stmt = products_stmt.offset((page - 1) * page_size)
+    items = (await db.execute(products_stmt)).all()
+
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(sort, product_cursor_key(sort, items[-1]))
+
+    product_facets = await _product_facets(db, filters, facet_names) if facet_names else None
     
-    # Явное преобразование ORM-объектов в Pydantic модели
-    product_items = [
-        ProductResponce.model_validate(item) 
-        for item in items
-    ]
-
-    return ProductList(
-        items=product_items,
+    # Строки уже содержат ровно поля ответа: собираем схемы без повторной валидации
+    product_list = ProductList.model_construct(
+        items=[ProductResponce.from_row(item) for item in items],
         total=total,
+        total_exact=count == "exact",
         page=page,
-        page_size=page_size
+        page_size=page_size,
+        next_cursor=next_cursor,
+        facets=product_facets,
     )
+    payload = product_list.model_dump_json().encode()
+    if cache_key is not None:
+        await catalog_results.set(
+            cache_key, payload, token,
+            product_ids=[item.id for item in items], from_replica=replica_set.is_replica(db),
+        )
+    return catalog_response(request, payload)
     
+@router.get("/search", response_model=ProductList)
+@query_budget(4)
+async def search_products(
+    request: Request,
+    q: str = Query(..., min_length=2, max_length=100, description="Поисковый запрос"),
+    page_size: int = Query(20, ge=1, le=100, description="Количество товаров на странице"),
+    category_id: Optional[int] = Query(
+        None, description="ID категории для фильтрации"
+    ),
+    include_descendants: bool = Query(
+        False, description="true — учитывать также товары всех подкатегорий category_id"
+    ),
+    min_price: Optional[float] = Query(
+        None, ge=0, description="Минимальная цена товара"
+    ),
+    max_price: Optional[float] = Query(
+        None, ge=0, description="Максимальная цена товара"
+    ),
+    in_stock: Optional[bool] = Query(
+        None, description="true — только товары в наличии, false — только без остатка"
+    ),
+    seller_id: Optional[int] = Query(
+        None, description="ID продавца для фильтрации"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы (next_cursor из предыдущего ответа)"
+    ),
+    count: str = Query(
+        "exact", pattern="^(exact|none)$",
+        description="Подсчёт total: exact — точно, none — не считать"
+    ),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Ищет активные товары по названию и описанию.
+
+    Совпадением считается полнотекстовое совпадение (websearch_to_tsquery по
+    сгенерированной колонке search_vector) или похожесть названия по триграммам
+    (pg_trgm) — так находятся и товары с опечатками в запросе.
+    Результаты упорядочены по релевантности; фильтры те же, что и у списка товаров.
+    Следующие страницы запрашиваются только по курсору.
+    """
+    _check_price_range(min_price, max_price)
+    filters = await _build_product_filters(
+        db, category_id, include_descendants, min_price, max_price, in_stock, seller_id
+    )
+
+    ts_query = func.websearch_to_tsquery("russian", q)
+    filters.append(or_(Product.search_vector.op("@@")(ts_query), Product.name.op("%")(q)))
+    rank = (func.ts_rank_cd(Product.search_vector, ts_query) + func.similarity(Product.name, q)).label("rank")
+
+    total = None
+    if count == "exact":
+        count_key = (
+            "search",
+            q,
+            category_id,
+            include_descendants,
+            Decimal(str(min_price)) if min_price is not None else None,
+            Decimal(str(max_price)) if max_price is not None else None,
+            in_stock,
+            seller_id,
+        )
+        total = await _count_products(db, filters, count, count_key)
+
+    search_stmt = (
+        select(Product, rank)
+        .where(*filters)
+        .order_by(rank.desc(), Product.id.desc())
+        .limit(page_size + 1)
+    )
+    if cursor is not None:
+        key = decode_cursor(cursor, "relevance")
+        try:
+            last_rank, last_id = float(key[0]), int(key[1])
+        except (IndexError, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Некорректный курсор пагинации",
+            )
+        search_stmt = search_stmt.where(tuple_(rank, Product.id) < tuple_(last_rank, last_id))
+    rows = (await db.execute(search_stmt)).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last_product, last_rank = rows[-1]
+        next_cursor = encode_cursor("relevance", [last_rank, last_product.id])
+
+    product_list = ProductList(
+        items=[ProductResponce.model_validate(product) for product, _ in rows],
+        total=total,
+        total_exact=count == "exact",
+        page=1,
+        page_size=page_size,
+        next_cursor=next_cursor,
+    )
+    return catalog_response(request, product_list.model_dump_json().encode())
+
 @router.post("/", response_model=ProductResponce, status_code=status.HTTP_201_CREATED)
 async def create_product(
         product: ProductCreate = Depends(ProductCreate.as_form),
@@ -161,7 +493,7 @@ async def create_product(
                             detail="Category not found or inactive")
 
     # Сохранение изображения (если есть)
-    image_url = await save_product_image(image) if image else None
+    image_url = await save_product_image(db, image) if image else None
 
     # Создание товара
     db_product = Product(
@@ -171,12 +503,93 @@ async def create_product(
     )
 
     db.add(db_product)
+    await db.flush()
+    await publish_change(db, "products", db_product.id)
     await db.commit()
     await db.refresh(db_product)
+    invalidate("products", db_product.id)
     return db_product
 
+@router.get("/export")
+async def export_products(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Формат выгрузки: ndjson или csv"),
+    current_user: User = Depends(get_current_seller),
+):
+    """
+    Потоковая выгрузка всех товаров текущего продавца (включая неактивные).
+    Строки читаются порциями по id, каждая — в отдельной короткой транзакции.
+    """
+    stmt = select(*PRODUCT_RESPONSE_COLUMNS).where(Product.seller_id == current_user.id)
+    return export_response(stmt, {"id": Product.id}, format, "products")
+
+@router.post("/import", response_model=ProductImportReport, status_code=status.HTTP_202_ACCEPTED)
+async def import_products(
+    background_tasks: BackgroundTasks,
+    response: Response,
+    file: UploadFile = File(..., description="CSV или NDJSON с полями name, description, price, stock, category_id"),
+    format: Optional[str] = Form(None, pattern="^(csv|ndjson)$", description="Формат файла; по умолчанию — по расширению"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_seller),
+):
+    """
+    Массовый импорт товаров текущего продавца (только для 'seller').
+
+    Строки проверяются пачками по правилам ProductCreate, категории сверяются
+    с одним заранее загруженным набором активных категорий. Корректные строки
+    загружаются через COPY во временную таблицу и переносятся в products одним запросом,
+    строки с ошибками попадают в отчёт.
+    Небольшие файлы обрабатываются сразу (200 и готовый отчёт), большие — фоновой
+    задачей (202), статус которой отдаёт GET /api/products/import/{job_id}.
+    """
+    if format is None:
+        suffix = Path(file.filename or "").suffix.lower()
+        format = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}.get(suffix)
+        if format is None:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Unknown import format, use csv or ndjson")
+
+    fd, temp_name = tempfile.mkstemp(prefix="product-import-", suffix=f".{format}")
+    os.close(fd)
+    path = Path(temp_name)
+    try:
+        size = await asyncio.to_thread(spool_upload, file.file, path, PRODUCT_IMPORT_MAX_BYTES)
+    except ImportTooLarge:
+        path.unlink(missing_ok=True)
+        raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "Import file is too large")
+
+    job = ProductImportJob(seller_id=current_user.id, status="pending", errors=[])
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+
+    if size <= PRODUCT_IMPORT_INLINE_MAX_BYTES:
+        await run_import(job.id, path, format, current_user.id)
+        await db.refresh(job)
+        response.status_code = status.HTTP_200_OK
+        return job
+
+    background_tasks.add_task(run_import, job.id, path, format, current_user.id)
+    return job
+
+@router.get("/import/{job_id}", response_model=ProductImportReport)
+async def get_import_status(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_seller),
+):
+    """
+    Возвращает статус и отчёт задачи импорта текущего продавца.
+    """
+    job = await db.scalar(
+        select(ProductImportJob).where(
+            ProductImportJob.id == job_id, ProductImportJob.seller_id == current_user.id
+        )
+    )
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    return job
+
 @router.get('/categories/{category_id}', response_model=list[ProductResponce], status_code=status.HTTP_200_OK)
-async def get_products_by_category(category_id: int, db: AsyncSession = Depends(get_async_db)):
+async def get_products_by_category(category_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Возвращает список товаров в указанной категории по её ID.
     """
@@ -198,14 +611,22 @@ async def get_products_by_category(category_id: int, db: AsyncSession = Depends(
     )
     product_result = await db.execute(product_stmt)
     products = product_result.scalars().all()
-    
-    return products
+
+    return catalog_response(request, _product_list_adapter.dump_json(
+        [ProductResponce.model_validate(product) for product in products]
+    ))
 
 @router.get("/{product_id}", response_model=ProductResponce)
-async def get_product(product_id: int, db: AsyncSession = Depends(get_async_db)):
+@query_budget(2)
+async def get_product(product_id: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
     """
     Возвращает детальную информацию о товаре по его ID.
     """
+    cache_key = f"product:{product_id}"
+    cached, token = await catalog_results.get(cache_key)
+    if cached is not None:
+        return catalog_response(request, cached)
+
     # Проверяем, существует ли активный товар
     product_result = await db.scalars(
         select(Product).where(Product.id == product_id, Product.is_active == True)
@@ -224,7 +645,11 @@ async def get_product(product_id: int, db: AsyncSession = Depends(get_async_db))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Category not found or inactive")
 
-    return product
+    payload = ProductResponce.model_validate(product).model_dump_json().encode()
+    await catalog_results.set(
+        cache_key, payload, token, product_ids=[product_id], from_replica=replica_set.is_replica(db)
+    )
+    return catalog_response(request, payload)
 
 
 from sqlalchemy import update
@@ -259,12 +684,17 @@ async def update_product(
         update(Product).where(Product.id == product_id).values(**product.model_dump())
     )
 
+    old_image_url = None
     if image:
-        remove_product_image(db_product.image_url)
-        db_product.image_url = await save_product_image(image)
+        old_image_url = db_product.image_url
+        db_product.image_url = await save_product_image(db, image)
 
+    await publish_change(db, "products", product_id)
     await db.commit()
     await db.refresh(db_product)
+    invalidate("products", product_id)
+    if old_image_url != db_product.image_url:
+        await remove_product_image(db, old_image_url)
     return db_product
 
 @router.delete("/{product_id}", response_model=ProductResponce)
@@ -287,48 +717,10 @@ async def delete_product(
     await db.execute(
         update(Product).where(Product.id == product_id).values(is_active=False)
     )
-    remove_product_image(product.image_url)
 
+    await publish_change(db, "products", product_id)
     await db.commit()
     await db.refresh(product)
+    invalidate("products", product_id)
+    await remove_product_image(db, product.image_url)
     return product
-
-async def save_product_image(file: UploadFile) -> str:
-    """
-    Сохраняет изображение товара и возвращает относительный URL.
-    """
-    if file.content_type not in ALLOWED_IMAGE_TYPES:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Only JPG, PNG or WebP images are allowed")
-
-    content = await file.read()
-    if len(content) > MAX_IMAGE_SIZE:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Image is too large")
-
-    extension = Path(file.filename or "").suffix.lower() or ".jpg"
-    file_name = f"{uuid.uuid4()}{extension}"
-    file_path = MEDIA_ROOT / file_name
-    file_path.write_bytes(content)
-
-    return f"/media/products/{file_name}"
-
-def remove_product_image(url: str | None) -> None:
-    """
-    Удаляет файл изображения, если он существует.
-    """
-    if not url:
-        return
-    relative_path = url.lstrip("/")
-    file_path = BASE_DIR / relative_path
-    if file_path.exists():
-        file_path.unlink()
-
-
-
-
-
-
-
-
-
-
-
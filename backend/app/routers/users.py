@@ -4,12 +4,14 @@ from sqlalchemy import select, update
 from app.schemas import UserCreate, UserResponce, RefreshTokenRequest
 from app.models.users import User 
 from fastapi.security import OAuth2PasswordRequestForm
-from app.auth import hash_password, verify_password, create_access_token, create_refresh_token, get_current_user
+from app.auth import hash_password_async, verify_password_async, create_access_token, create_refresh_token, get_current_user
 import jwt
 from app.config import SECRET_KEY, ALGORITHM
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db_depends import get_async_db
+from app.cache import invalidate
+from app.change_feed import publish_change
 
 router = APIRouter(prefix="/api/users",
                    tags=["users"],
@@ -39,7 +41,7 @@ async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)
     # Создание объекта пользователя с хешированным паролем
     db_user = User(
         email=user.email,
-        hashed_password=hash_password(user.password),
+        hashed_password=await hash_password_async(user.password),
         is_active=True,
         role=user.role
     )
@@ -58,7 +60,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(),
     result = await db.scalars(
         select(User).where(User.email == form_data.username, User.is_active == True))
     user = result.first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -84,7 +86,9 @@ async def delete_user(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found or inactive")
  
     await db.execute(update(User).where(User.id == user_id).values(is_active=False))
+    await publish_change(db, "users", user_id)
     await db.commit() # Для возврата is_active = False
+    invalidate("users", user_id)
     return user
 
 @router.post("/refresh_token")
@@ -1,7 +1,8 @@
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, computed_field
 from decimal import Decimal
 from typing import Optional
 from app.models import Product
+from app.images import product_image_variants
 from datetime import datetime
 from typing import Annotated
 from pydantic import Field
@@ -28,6 +29,15 @@ class CategoryResponce(BaseModel):
     is_active: bool = Field(..., description="Активность категории")
     model_config = ConfigDict(from_attributes=True)
 
+class CategoryTreeNode(BaseModel):
+    """
+    Узел дерева категорий с вложенными дочерними категориями.
+    """
+    id: int
+    name: str = Field(..., description="Название категории")
+    parent_id: Optional[int] = Field(None, description="ID родительской категории, если есть")
+    children: list["CategoryTreeNode"] = Field(default_factory=list, description="Дочерние категории")
+
 class ProductCreate(BaseModel):
     """
     Модель для создания и обновления товара.
@@ -91,19 +101,94 @@ class ProductResponce(BaseModel):
     category_id: int = Field(..., description="ID категории")
     is_active: bool = Field(..., description="Активность товара")
 
+    @computed_field(description="URL вариантов изображения (thumb, medium); пока вариант не готов, по его URL отдаётся оригинал")
+    @property
+    def image_variants(self) -> dict[str, str] | None:
+        return product_image_variants(self.image_url)
+
+    @classmethod
+    def from_row(cls, row) -> "ProductResponce":
+        """
+        Собирает схему из строки с колонками PRODUCT_RESPONSE_COLUMNS без валидации:
+        значения пришли из БД и уже соответствуют схеме.
+        """
+        return cls.model_construct(
+            id=row.id,
+            name=row.name,
+            description=row.description,
+            price=row.price,
+            image_url=row.image_url,
+            stock=row.stock,
+            category_id=row.category_id,
+            is_active=row.is_active,
+        )
+
     model_config = ConfigDict(from_attributes=True)   
 
+class CategoryFacet(BaseModel):
+    category_id: int = Field(..., description="ID категории")
+    count: int = Field(..., ge=0, description="Количество товаров в категории")
+
+class PriceFacet(BaseModel):
+    min_price: Decimal = Field(..., ge=0, description="Нижняя граница корзины (включительно)")
+    max_price: Decimal | None = Field(None, description="Верхняя граница корзины (не включительно), null — без ограничения")
+    count: int = Field(..., ge=0, description="Количество товаров в ценовой корзине")
+
+class StockFacet(BaseModel):
+    in_stock: int = Field(..., ge=0, description="Количество товаров в наличии")
+    out_of_stock: int = Field(..., ge=0, description="Количество товаров без остатка")
+
+class ProductFacets(BaseModel):
+    """
+    Фасетные счётчики для текущего набора фильтров.
+    """
+    category: list[CategoryFacet] | None = Field(None, description="Количество товаров по категориям")
+    price: list[PriceFacet] | None = Field(None, description="Количество товаров по ценовым корзинам")
+    in_stock: StockFacet | None = Field(None, description="Количество товаров по наличию")
+
 class ProductList(BaseModel):
     """
     Список пагинации для товаров.
     """
     items: list[ProductResponce] = Field(description="Товары для текущей страницы")
-    total: int = Field(ge=0, description="Общее количество товаров")
+    total: int | None = Field(
+        None, ge=0, description="Общее количество товаров (null при count=none)"
+    )
+    total_exact: bool = Field(
+        True, description="true — total посчитан точно, false — это оценка планировщика"
+    )
     page: int = Field(ge=1, description="Номер текущей страницы")
     page_size: int = Field(ge=1, description="Количество элементов на странице")
+    next_cursor: str | None = Field(
+        None, description="Курсор следующей страницы (None, если страниц больше нет)"
+    )
+    facets: ProductFacets | None = Field(
+        None, description="Фасетные счётчики (только если запрошены параметром facets)"
+    )
     
     model_config = ConfigDict(from_attributes=True)  # Для чтения из ORM-объектов
 
+class ProductImportError(BaseModel):
+    row: int = Field(..., ge=0, description="Номер строки данных (0 — ошибка файла целиком)")
+    errors: list[str] = Field(..., description="Описание ошибок в строке")
+
+class ProductImportReport(BaseModel):
+    """
+    Статус и отчёт задачи массового импорта товаров.
+    """
+    job_id: int = Field(..., validation_alias="id", description="ID задачи импорта")
+    status: str = Field(..., description="pending, running, done или failed")
+    total_rows: int = Field(..., ge=0, description="Обработано строк")
+    imported_rows: int = Field(..., ge=0, description="Загружено товаров")
+    error_count: int = Field(..., ge=0, description="Строк с ошибками")
+    errors: list[ProductImportError] = Field(
+        default_factory=list, description="Ошибки по строкам (не больше PRODUCT_IMPORT_MAX_ERRORS)"
+    )
+    created_at: datetime = Field(..., description="Когда задача создана")
+    finished_at: datetime | None = Field(None, description="Когда задача завершилась")
+
+    model_config = ConfigDict(from_attributes=True)
+
 class UserCreate(BaseModel):
     email: str = Field(..., description="Email пользователя")
     password: str = Field(min_length=8, description="Пароль (минимум 8 символов)")
@@ -131,6 +216,18 @@ class CartItemUpdate(BaseModel):
     """Модель для обновления количества товара в корзине."""
     quantity: int = Field(..., ge=1, description="Новое количество товара")
 
+class CartItemBatchOperation(BaseModel):
+    """Одна операция пакетного изменения корзины."""
+    product_id: int = Field(description="ID товара")
+    quantity: int = Field(0, ge=0, description="Количество (для add и set)")
+    mode: str = Field("add", pattern="^(add|set|remove)$",
+                      description="add — прибавить, set — установить, remove — удалить")
+
+class CartItemBatch(BaseModel):
+    """Модель для пакетного изменения корзины."""
+    items: list[CartItemBatchOperation] = Field(..., min_length=1, max_length=100,
+                                                description="Операции в порядке применения")
+
 from app.routers.products import ProductResponce 
 
 class CartItem(BaseModel):
@@ -150,6 +247,13 @@ class Cart(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+class CartSummary(BaseModel):
+    """Итоги корзины без списка товаров (для счётчика в шапке)."""
+    item_count: int = Field(..., ge=0, description="Количество позиций")
+    total_quantity: int = Field(..., ge=0, description="Общее количество товаров")
+    total_price: Decimal = Field(..., ge=0, description="Общая стоимость товаров")
+    revision: str = Field(..., description="Ревизия итогов: меняется при любом изменении корзины")
+
 class OrderItem(BaseModel):
     id: int = Field(..., description="ID позиции заказа")
     product_id: int = Field(..., description="ID товара")
@@ -0,0 +1,52 @@
+"""
+Помощники для тестов: проверка бюджета SQL-запросов маршрутов.
+
+    from app.testing import assert_query_budget, track_queries
+
+    def test_product_detail_queries(client):
+        with track_queries():
+            response = client.get("/api/products/1")
+        assert_query_budget(response)
+"""
+from contextlib import contextmanager
+from collections.abc import Iterator
+
+from app import query_budget
+
+
+@contextmanager
+def track_queries(repeat_threshold: int | None = None) -> Iterator[None]:
+    """
+    Включает подсчёт запросов (режим log) на время блока.
+    """
+    previous_mode, previous_threshold = query_budget.mode, query_budget.repeat_threshold
+    query_budget.mode = "log"
+    if repeat_threshold is not None:
+        query_budget.repeat_threshold = repeat_threshold
+    query_budget.last_report = None
+    try:
+        yield
+    finally:
+        query_budget.mode, query_budget.repeat_threshold = previous_mode, previous_threshold
+
+
+def assert_query_budget(response, max_queries: int | None = None, allow_repeats: bool = False) -> dict:
+    """
+    Падает, если последний запрос превысил бюджет маршрута (@query_budget) или max_queries,
+    либо выполнил повторяющиеся запросы одной формы (N+1). Возвращает отчёт.
+    """
+    report = query_budget.last_report
+    if report is None or "x-query-count" not in response.headers:
+        raise AssertionError("Query tracking is off: wrap the request in track_queries()")
+
+    problems = []
+    budget = max_queries if max_queries is not None else report["budget"]
+    if budget is not None and report["count"] > budget:
+        problems.append(f"{report['count']} queries, budget is {budget}")
+    if not allow_repeats:
+        problems.extend(f"possible N+1: {count}x {shape}" for shape, count in report["repeated"])
+    if problems:
+        raise AssertionError(
+            f"{report['method']} {report['route']} exceeded its query budget:\n  " + "\n  ".join(problems)
+        )
+    return report
@@ -0,0 +1,120 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app import query_budget
+from app.query_budget import QueryBudgetMiddleware, QueryLog, statement_shape
+from app.testing import assert_query_budget, track_queries
+
+
+engine = create_engine("sqlite://")
+query_budget.instrument_engine(engine)
+
+api = FastAPI()
+api.add_middleware(QueryBudgetMiddleware)
+
+
+def run_queries(*statements: str) -> None:
+    with engine.connect() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+
+
+@api.get("/within")
+@query_budget.query_budget(2)
+def within_budget():
+    run_queries("SELECT 1", "SELECT 2")
+    return {}
+
+
+@api.get("/over")
+@query_budget.query_budget(1)
+def over_budget():
+    run_queries("SELECT 1", "SELECT 2")
+    return {}
+
+
+@api.get("/n-plus-one")
+@query_budget.query_budget(10)
+def n_plus_one():
+    with engine.connect() as connection:
+        for product_id in range(4):
+            connection.execute(text("SELECT :id"), {"id": product_id})
+    return {}
+
+
+client = TestClient(api)
+
+
+def test_statement_shape_collapses_parameters():
+    assert statement_shape(
+        "SELECT products.id FROM products\n  WHERE products.id IN ($1::INTEGER, $2::INTEGER, $3::INTEGER)"
+        " AND products.name = $4::VARCHAR(100)"
+    ) == "SELECT products.id FROM products WHERE products.id IN (?) AND products.name = ?"
+    assert statement_shape("SELECT $1::INTEGER") == statement_shape("SELECT $7::INTEGER")
+
+
+def test_query_log_reports_repeated_shapes(monkeypatch):
+    monkeypatch.setattr(query_budget, "repeat_threshold", 3)
+    query_log = QueryLog()
+    for product_id in range(3):
+        query_log.record(f"SELECT * FROM products WHERE id = ${product_id + 1}::INTEGER")
+    query_log.record("SELECT * FROM categories")
+
+    assert query_log.count == 4
+    assert query_log.repeated() == [("SELECT * FROM products WHERE id = ?", 3)]
+
+
+def test_tracking_is_off_by_default():
+    response = client.get("/over")
+
+    assert response.status_code == 200
+    assert "x-query-count" not in response.headers
+    with pytest.raises(AssertionError, match="track_queries"):
+        assert_query_budget(response)
+
+
+def test_route_within_budget_passes():
+    with track_queries():
+        response = client.get("/within")
+
+    assert response.headers["x-query-count"] == "2"
+    report = assert_query_budget(response)
+    assert report["budget"] == 2
+    assert report["route"] == "/within"
+
+
+def test_route_over_budget_fails():
+    with track_queries():
+        response = client.get("/over")
+
+    assert response.status_code == 200
+    with pytest.raises(AssertionError, match="2 queries, budget is 1"):
+        assert_query_budget(response)
+
+
+def test_explicit_limit_overrides_route_budget():
+    with track_queries():
+        response = client.get("/within")
+
+    with pytest.raises(AssertionError, match="2 queries, budget is 1"):
+        assert_query_budget(response, max_queries=1)
+
+
+def test_repeated_statements_are_reported_as_n_plus_one():
+    with track_queries(repeat_threshold=3):
+        response = client.get("/n-plus-one")
+
+    with pytest.raises(AssertionError, match="possible N\\+1: 4x SELECT \\?"):
+        assert_query_budget(response)
+    assert_query_budget(response, allow_repeats=True)
+
+
+def test_raise_mode_replaces_response(monkeypatch):
+    monkeypatch.setattr(query_budget, "mode", "raise")
+
+    response = client.get("/over")
+
+    assert response.status_code == 500
+    assert response.json() == {"detail": ["2 queries, budget is 1"]}